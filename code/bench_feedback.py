@@ -0,0 +1,47 @@
+# feedback kernel benchmark: query_res_all (one answer at a time) vs every pattern backend
+# python bench_feedback.py words.txt --answers 500
+import argparse
+import time
+
+import numpy as np
+
+from patterns import BACKENDS, DEFAULT_MEMORY_BUDGET, decode_words, encode_words, query_res_all, sorted_words
+
+
+def bench(words, answers, memory_budget=DEFAULT_MEMORY_BUDGET) -> dict:
+    '''
+    returns {kernel: pairs/s}, guess는 words 전체, 정답은 words[answers]
+    '''
+    text = decode_words(words)
+    pairs = len(words) * len(answers)
+
+    start_time = time.time()
+    reference = np.stack([query_res_all(text[y], text) for y in answers], axis=1).astype(np.uint8)
+    rates = {"query_res_all": pairs / (time.time() - start_time)}
+
+    for name, kernel in BACKENDS.items():
+        start_time = time.time()
+        codes = kernel(words, words[answers], memory_budget=memory_budget)
+        rates[name] = pairs / (time.time() - start_time)
+        mismatches = int((codes != reference).sum())
+        if mismatches:
+            raise AssertionError(f"{name}: {mismatches} codes differ from query_res_all")
+    return rates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the feedback kernels against query_res_all")
+    parser.add_argument("word_files", nargs="*", default=["words.txt"])
+    parser.add_argument("--answers", type=int, default=500, help="answers per list, query_res_all is slow")
+    parser.add_argument("--memory-budget-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 2**20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for word_file in args.word_files:
+        words = sorted_words(encode_words(open(word_file).read().strip().split('\n')))
+        answers = np.sort(rng.choice(len(words), min(args.answers, len(words)), replace=False))
+        rates = bench(words, answers, int(args.memory_budget_mb * 2**20))
+        base = rates["query_res_all"]
+        print(f"{word_file}: {len(words)} x {len(answers)} pairs, all kernels agree")
+        for name, rate in rates.items():
+            print(f"  {name:>14}: {rate / 1e6:8.2f}M pairs/s ({rate / base:6.1f}x)")
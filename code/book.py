@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from patterns import CACHE_DIR, feedback_codes, fingerprint
+from scoring import DEFAULT_RAM_CAP, BucketHistograms, best_guess
+from search import BEAM_BRANCH, BEAM_LIMIT, ExactSolver, SearchTimeout
+
+
+def book_path(words, cache_dir=None) -> str:
+    return os.path.join(cache_dir or CACHE_DIR, f"{fingerprint(words)}.book.json")
+
+
+def load_book(words, cache_dir=None):
+    '''
+    {"first": guess, "second": {feedback code: guess}}, guess는 정렬된 words의 인덱스. 없으면 None
+    opening.py가 고정 pair를 쓴 book에는 "pair": [first, second]도 있다
+    '''
+    path = book_path(words, cache_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        book = json.load(f)
+    book["second"] = {int(code): guess for code, guess in book["second"].items()}
+    return book
+
+
+def save_book(words, book, cache_dir=None):
+    path = book_path(words, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({**book, "second": {str(code): guess for code, guess in book["second"].items()}}, f)
+    os.replace(tmp_path, path)
+
+
+def choose_guess(words, plausible_idx, histograms, beam=None, cancel=None):
+    # beam search (ExactSolver with BEAM_BRANCH) for small sets, otherwise entropy plus a small bonus for possible answers
+    if beam is not None and len(plausible_idx) <= BEAM_LIMIT:
+        return beam.best(plausible_idx)[0]
+    histograms.restrict(plausible_idx)
+    bonus = np.zeros(len(words))
+    bonus[plausible_idx] = 1 / len(plausible_idx)
+    guess, _, _, complete = best_guess(np.arange(len(words)), plausible_idx, words, histograms.rows, bonus, cancel=cancel)
+    if not complete:
+        raise SearchTimeout
+    return int(guess)
+
+
+class BookBuilder:
+    '''
+    build_book을 guess 하나씩 나눠서 만든다. run(cancel)은 cancel이 set되면 SearchTimeout으로 멈추고,
+    다시 부르면 이미 정한 guess와 beam search의 table을 그대로 두고 이어서 만든다
+    (솔버는 턴 사이의 빈 시간에만 돌리고 턴이 시작하면 멈춘다)
+    '''
+
+    def __init__(self, words, patterns=None, ram_cap=DEFAULT_RAM_CAP):
+        self.words = words
+        self.patterns = patterns
+        self.ram_cap = ram_cap
+        self.beam = ExactSolver(words, patterns, branch=BEAM_BRANCH)
+        self.book = {"first": None, "second": {}}
+
+    def run(self, cancel=None) -> dict:
+        words, patterns = self.words, self.patterns
+        self.beam.cancel = cancel
+        all_idx = np.arange(len(words))
+        if self.book["first"] is None:
+            self.book["first"] = choose_guess(words, all_idx, BucketHistograms(words, patterns, self.ram_cap), self.beam, cancel)
+        first = self.book["first"]
+
+        if patterns is not None:
+            first_codes = np.asarray(patterns[first])
+        else:
+            first_codes = feedback_codes(words[[first]], words)[0]
+
+        second = self.book["second"]
+        for code in np.unique(first_codes):
+            bucket = all_idx[first_codes == code]
+            if len(bucket) < 2 or int(code) in second:
+                continue
+            if cancel is not None and cancel.is_set():
+                raise SearchTimeout
+            second[int(code)] = choose_guess(words, bucket, BucketHistograms(words, patterns, self.ram_cap), self.beam, cancel)
+        return self.book
+
+
+def build_book(words, patterns=None, ram_cap=DEFAULT_RAM_CAP) -> dict:
+    '''
+    첫 번째 guess와, 첫 피드백 코드마다의 두 번째 guess (정답이 하나만 남는 코드는 뺀다)
+    '''
+    return BookBuilder(words, patterns, ram_cap).run()
+
+
+if __name__ == "__main__":
+    # python book.py words.txt
+    import argparse
+    import time
+
+    from patterns import decode_words, encode_words, load_pattern_matrix, sorted_words
+
+    parser = argparse.ArgumentParser(description="build the opening book of a word list ahead of the games")
+    parser.add_argument("word_file", nargs="?", default="words.txt")
+    parser.add_argument("--cache-dir", default=None)
+    args = parser.parse_args()
+
+    words = sorted_words(encode_words(open(args.word_file).read().strip().split('\n')))
+    start_time = time.time()
+    patterns = load_pattern_matrix(words, cache_dir=args.cache_dir)
+    book = build_book(words, patterns)
+    save_book(words, book, args.cache_dir)
+    print(f"{decode_words(words[[book['first']]])[0]} + {len(book['second'])} second guesses in {time.time() - start_time:.2f}s")
@@ -0,0 +1,87 @@
+import numpy as np
+
+from patterns import encode_words
+
+
+class ConstraintIndex:
+    '''
+    (guess, feedback) 하나를 비트 연산 몇 번으로 바꿔서 살아남는 단어를 찾는 인덱스
+    - position[i][c]: i번째 글자가 c인 단어들의 bitset
+    - at_least[c][k]: c가 k개 이상 들어있는 단어들의 bitset (k = 0..5)
+    feedback이 같다 <=> 초록 칸이 정확히 같고, 각 글자의 개수가 (회색이 있으면) 정확히 / (없으면) 최소 초록+노랑 개수
+    '''
+
+    def __init__(self, words):
+        words = encode_words(words)
+        self.size = words.shape[0]
+
+        onehot = words[:, :, None] == np.arange(26, dtype=np.uint8) # (N, 5, 26)
+        self.position = np.packbits(onehot.transpose(1, 2, 0), axis=-1) # (5, 26, B)
+
+        counts = onehot.sum(axis=1) # (N, 26)
+        self.at_least = np.packbits(counts.T[:, None, :] >= np.arange(6)[None, :, None], axis=-1) # (26, 6, B)
+        self.full = self.at_least[0, 0]
+
+    def matches(self, guess, feedback) -> np.ndarray:
+        guess = encode_words([guess])[0] if isinstance(guess, str) else guess
+        alive = self.full.copy()
+
+        for i in range(5):
+            if feedback[i] == 2:
+                alive &= self.position[i, guess[i]]
+            else:
+                alive &= ~self.position[i, guess[i]]
+
+        for c in set(guess.tolist()):
+            marks = [feedback[i] for i in range(5) if guess[i] == c]
+            hits = sum(1 for f in marks if f > 0)
+            alive &= self.at_least[c, hits]
+            if 0 in marks:
+                alive &= ~self.at_least[c, hits + 1]
+        return alive
+
+    def filter(self, guess, feedback, idx=None) -> np.ndarray:
+        '''
+        idx 중에서 (guess, feedback)과 모순되지 않는 단어들의 인덱스. idx가 없으면 전체에서 찾는다
+        '''
+        mask = np.unpackbits(self.matches(guess, feedback), count=self.size).view(bool)
+        if idx is None:
+            return np.flatnonzero(mask)
+        return idx[mask[idx]]
+
+
+class PostingLists:
+    '''
+    pattern matrix가 있을 때 (guess, 피드백 코드) -> 그 코드를 주는 정답들 (CSR)
+    guess마다 처음 필요할 때 한 행을 코드별로 정렬해 둔다
+    - indices[g]: 코드 순으로 묶인 정답 인덱스 (같은 코드 안에서는 오름차순)
+    - indptr[g][c]:indptr[g][c + 1]: 코드 c를 주는 정답들의 구간
+    '''
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.indptr = {}
+        self.indices = {}
+
+    def answers(self, guess, code) -> np.ndarray:
+        if guess not in self.indices:
+            row = np.asarray(self.patterns[guess])
+            # stable sort on uint8 is a radix sort, and keeps each code's answers ascending
+            self.indices[guess] = np.argsort(row, kind="stable")
+            self.indptr[guess] = np.concatenate([[0], np.cumsum(np.bincount(row, minlength=243))])
+        indptr = self.indptr[guess]
+        return self.indices[guess][indptr[code]:indptr[code + 1]]
+
+    def filter(self, guess, code, idx=None) -> np.ndarray:
+        '''
+        idx (정렬된 인덱스) 중에서 guess에 code를 주는 정답들. idx가 없으면 구간 그대로
+        '''
+        hits = self.answers(guess, code)
+        if idx is None or len(idx) == len(self.patterns):
+            return hits
+        if len(idx) == 0:
+            # after a bad translation the plausible set can be empty, and stays empty
+            return hits[:0]
+        # both sides are sorted: look each hit up in idx
+        pos = np.minimum(np.searchsorted(idx, hits), len(idx) - 1)
+        return hits[idx[pos] == hits]
@@ -14,6 +14,8 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
+from rules import get_rule
+
 load_dotenv()
 
 class RunLLM:
@@ -97,31 +99,12 @@ def make_problems(num_test_sets = 20):
         }
 
 
-def compute_feedback(secret, guess):
-    feedback = [0] * 5  # Default: 0
-    secret_chars = list(secret)
-    guess_chars = list(guess)
-
-    # First pass: assign 2 (correct position)
-    for i in range(5):
-        if guess_chars[i] == secret_chars[i]:
-            feedback[i] = 2
-            secret_chars[i] = None
-            guess_chars[i] = None
-
-    # Count remaining letters in secret
-    remaining = {}
-    for ch in secret_chars:
-        if ch:
-            remaining[ch] = remaining.get(ch, 0) + 1
+# the grader scores with the standard two-pass rule; python rules.py checks it against the solver's rule
+GRADER_RULE = "two_pass"
 
-    # Second pass: assign 1 (misplaced)
-    for i in range(5):
-        if guess_chars[i] and remaining.get(guess_chars[i], 0) > 0:
-            feedback[i] = 1
-            remaining[guess_chars[i]] -= 1
 
-    return feedback
+def compute_feedback(secret, guess, rule=GRADER_RULE):
+    return get_rule(rule).reference(guess, secret)
 
 
 def verbalize_feedback(secret, guess, feedback, useLLM = True):
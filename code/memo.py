@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from patterns import CACHE_DIR
+
+# one JSON line [key, guess, score, quality] per put, later lines win
+MEMO_PATH = os.path.join(CACHE_DIR, "state_memo.jsonl")
+
+
+def state_key(fingerprint, rule, strategy, plausible_idx) -> str:
+    '''
+    같은 단어 목록 / 피드백 규칙 / 전략에서 같은 plausible 집합이면 guess 기록이 달라도 같은 상태
+    plausible 인덱스는 정렬된 words 기준이라 집합을 정렬해서 해시하면 된다
+    '''
+    digest = hashlib.blake2b(np.sort(np.asarray(plausible_idx, dtype='<i4')).tobytes(), digest_size=12).hexdigest()
+    return f"{fingerprint}:{rule}:{strategy}:{digest}"
+
+
+class StateMemo:
+    '''
+    게임 상태 -> (guess, score, quality), 프로세스 안의 모든 문제가 공유하는 LRU
+    quality는 그 guess를 고른 전략의 GuessStrategy.quality, 더 좋은 전략으로 다시 구하면 덮어쓴다
+    max_entries를 넘으면 가장 오래 안 쓴 상태부터 버린다
+    파일은 append-only 기록이라 put은 한 줄만 쓴다. 기록이 살아 있는 상태의 두 배를 넘으면
+    시작할 때 (턴 밖에서) 살아 있는 상태만 최근에 쓴 순서대로 다시 쓰고, compact()는 종료할 때도 부른다
+    '''
+
+    def __init__(self, path=None, max_entries=100_000):
+        self.path = path or MEMO_PATH
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        key, guess, score, quality = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    lines += 1
+                    self.entries[key] = (guess, score, quality)
+                    self.entries.move_to_end(key)
+            self._evict()
+        if lines > 2 * max(len(self.entries), 1):
+            self.compact()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.journal = open(self.path, "a")
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, guess, score, quality):
+        entry = (int(guess), None if score is None else float(score), int(quality))
+        with self.lock:
+            old = self.entries.get(key)
+            if old is not None and old[2] > quality:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self._evict()
+            self.journal.write(json.dumps([key, *entry]) + "\n")
+            self.journal.flush()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def compact(self):
+        '''
+        기록을 살아 있는 상태만으로 다시 쓴다 (전체를 직렬화하므로 턴 중에는 부르지 않는다)
+        '''
+        with self.lock:
+            items = [json.dumps([key, *entry]) + "\n" for key, entry in self.entries.items()]
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(items)
+            os.replace(tmp_path, self.path)
+            if getattr(self, "journal", None) is not None:
+                self.journal.close()
+                self.journal = open(self.path, "a")
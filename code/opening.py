@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+from book import load_book, save_book
+from patterns import encode_words, load_pattern_matrix, pattern_matrix_path, sorted_words
+from scoring import DEFAULT_RAM_CAP, NUM_CODES, bucket_counts, nlogn_table, score_counts
+
+# (code1, code2) -> code1 * 243 + code2
+PAIR_CODES = NUM_CODES * NUM_CODES
+
+
+def pair_entropies(first_codes, second_codes) -> np.ndarray:
+    '''
+    H(F1, F2) for one first guess (first_codes, (N,)) and every row of second_codes ((B, N))
+    두 코드를 59,049가지 코드 하나로 합치고, 행마다 정렬해서 같은 코드의 run 길이를 센다
+    (N이 수천일 때 59,049칸 bincount를 훑는 것보다 20배 이상 빠르다)
+    '''
+    B, N = second_codes.shape
+    joint = np.sort(first_codes.astype(np.int32) * NUM_CODES + second_codes, axis=1)
+    new = np.ones((B, N), dtype=bool)
+    new[:, 1:] = joint[:, 1:] != joint[:, :-1]
+    starts = np.flatnonzero(new)
+    sizes = np.diff(np.append(starts, B * N))
+    return np.log2(N) - np.bincount(starts // N, weights=nlogn_table(N)[sizes], minlength=B) / N
+
+
+_worker_state = None
+
+
+def _init_worker(path, candidates, entropy, ceiling, batch):
+    global _worker_state
+    _worker_state = (np.load(path, mmap_mode="r"), candidates, entropy, ceiling, batch)
+
+
+def _best_second(task):
+    '''
+    candidates[p]를 첫 guess로 두고 그 뒤의 candidates 중 최고의 두 번째 guess를 찾는다
+    H(g1, g2) <= min(H(g1) + H(g2), ceiling[g1], ceiling[g2]) 이고 entropy가 내림차순이므로
+    H(g1) + H(g2)가 bar 아래로 내려가면 멈추고, 그 전에는 ceiling으로 걸러낸다
+    returns (joint entropy, p, q, pairs evaluated)
+    '''
+    p, bar = task
+    patterns, candidates, entropy, ceiling, batch = _worker_state
+    first_codes = np.asarray(patterns[candidates[p]])
+    best, best_q, evaluated = bar, None, 0
+    # entropy[p] + entropy[q] > best holds for a prefix of q only
+    end = p + 1 + np.searchsorted(-entropy[p + 1:], entropy[p] - best)
+    q = p + 1
+    while q < end:
+        stop = min(q + batch, end)
+        rows = q + np.flatnonzero(ceiling[q:stop] > best)
+        q = stop
+        if len(rows) == 0:
+            continue
+        scores = pair_entropies(first_codes, np.asarray(patterns[candidates[rows]]))
+        evaluated += len(rows)
+        if scores.max() > best:
+            best, best_q = scores.max(), int(rows[np.argmax(scores)])
+            end = p + 1 + np.searchsorted(-entropy[p + 1:], entropy[p] - best)
+    return best, p, best_q, evaluated
+
+
+def best_opening_pair(words, patterns, candidates=300, processes=1, ram_cap=DEFAULT_RAM_CAP, path=None):
+    '''
+    한 수 엔트로피 상위 candidates개 중에서 두 guess를 고정했을 때의 결합 엔트로피 H(F1, F2)가 가장 큰 쌍을 찾는다
+    한 guess의 bucket b는 두 번째 guess로 많아야 min(|b|, 243)개로 나뉘므로
+    ceiling[g] = H(g) + sum_b p_b log2 min(|b|, 243) 도 결합 엔트로피의 상한이다
+    첫 guess마다 하나의 작업으로 프로세스 풀에 나눠 주고, 모든 작업은 처음에 구한 하한 (1등과 상위 몇 개의 쌍) 아래를 잘라낸다
+    returns (g1, g2, joint entropy, pairs evaluated)
+    '''
+    words = sorted_words(words)
+    N = len(words)
+    path = path or pattern_matrix_path(words)
+    counts = bucket_counts(np.arange(N), np.arange(N), words, patterns, ram_cap)
+    entropy = score_counts(counts).entropy
+    ceiling = entropy + (counts * np.log2(np.clip(counts, 1, NUM_CODES))).sum(axis=1) / N
+    order = np.argsort(-entropy, kind="stable")[:candidates]
+    entropy, ceiling = entropy[order], np.minimum(ceiling[order], np.log2(N))
+    # sorted int32 joint codes + run bookkeeping per word
+    batch = max(ram_cap // (N * 32), 1)
+
+    # seed the bar with the leader's best partner among the next few, so every task can prune from the start
+    _init_worker(path, order, entropy, ceiling, batch)
+    seed = pair_entropies(np.asarray(patterns[order[0]]), np.asarray(patterns[order[1:1 + batch]]))
+    best = (seed.max(), 0, 1 + int(np.argmax(seed)))
+    evaluated = len(seed)
+
+    # H(g1) + H(g1 + 1) bounds every pair that starts at p, and only shrinks with p
+    tasks = [(p, best[0]) for p in range(len(order) - 1)
+             if entropy[p] + entropy[p + 1] > best[0] and ceiling[p] > best[0]]
+    if processes > 1:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(path, order, entropy, ceiling, batch)) as pool:
+            results = list(pool.imap_unordered(_best_second, tasks))
+    else:
+        results = [_best_second(task) for task in tasks]
+
+    for score, p, q, count in results:
+        evaluated += count
+        if q is not None and score > best[0]:
+            best = (score, p, q)
+    score, p, q = best
+    return int(order[p]), int(order[q]), float(score), evaluated
+
+
+def write_pair_book(words, pair, cache_dir=None):
+    '''
+    고정된 opening pair를 그 단어 목록의 book에 쓴다: 첫 guess는 pair[0], 두 번째는 (정답이 셋 이상 남으면) 항상 pair[1]
+    정답이 두 개 이하로 남는 bucket은 그중 하나를 바로 맞추는 게 낫기 때문에 솔버에 맡긴다
+    '''
+    words = sorted_words(words)
+    patterns = load_pattern_matrix(words, build=False, cache_dir=cache_dir)
+    first_codes = np.asarray(patterns[pair[0]])
+    codes, sizes = np.unique(first_codes, return_counts=True)
+    book = load_book(words, cache_dir) or {}
+    book.update({
+        "first": pair[0],
+        "second": {int(code): pair[1] for code, size in zip(codes, sizes) if size > 2},
+        "pair": list(pair),
+    })
+    save_book(words, book, cache_dir)
+    return book
+
+
+if __name__ == "__main__":
+    # python opening.py words.txt --candidates 300 --processes 32
+    import argparse
+    import time
+
+    from patterns import decode_words
+
+    parser = argparse.ArgumentParser(description="find the best fixed pair of opening guesses and store it in the opening book")
+    parser.add_argument("word_file", nargs="?", default="words.txt")
+    parser.add_argument("--candidates", type=int, default=300, help="only pair the top guesses by single-guess entropy")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", default=None)
+    args = parser.parse_args()
+
+    words = sorted_words(encode_words(open(args.word_file).read().strip().split('\n')))
+    start_time = time.time()
+    patterns = load_pattern_matrix(words, cache_dir=args.cache_dir, processes=args.processes)
+    g1, g2, score, evaluated = best_opening_pair(words, patterns, args.candidates, args.processes,
+                                                 path=pattern_matrix_path(words, args.cache_dir))
+    write_pair_book(words, (g1, g2), args.cache_dir)
+
+    total = args.candidates * (args.candidates - 1) // 2
+    first, second = decode_words(words[[g1, g2]])
+    print(f"{first} + {second}: {score:.4f} bits, {evaluated:,}/{total:,} pairs in {time.time() - start_time:.2f}s")
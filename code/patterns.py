@@ -0,0 +1,325 @@
+import hashlib
+import os
+
+import numpy as np
+
+# pattern_matrix[g][a] = feedback code (sum of res[i] * 3**i) of guess g against answer a
+CACHE_DIR = os.environ.get(
+    "PATTERN_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pattern_cache"),
+)
+
+
+SHIFTS = np.array([20, 15, 10, 5, 0], dtype=np.uint32)
+SOLVED = 242 # feedback code of an all-green answer
+
+
+def encode_words(words) -> np.ndarray:
+    '''
+    (N, 5) uint8 letter codes ('a' = 0). 이미 인코딩된 배열이나 pack된 정수는 그대로 변환만 한다
+    '''
+    if isinstance(words, np.ndarray) and words.dtype == np.uint8:
+        return words
+    if isinstance(words, np.ndarray) and words.dtype == np.uint32:
+        return unpack_words(words)
+    return (np.frombuffer("".join(words).encode(), dtype=np.uint8).reshape(-1, 5) - ord('a')).astype(np.uint8)
+
+
+def decode_words(encoded) -> list[str]:
+    return [bytes(row).decode() for row in (encode_words(encoded) + ord('a')).astype(np.uint8)]
+
+
+def pack_words(encoded) -> np.ndarray:
+    # 5 bits per letter, first letter highest, so sorting packed ints sorts the words
+    return (encode_words(encoded).astype(np.uint32) << SHIFTS).sum(axis=1, dtype=np.uint32)
+
+
+def unpack_words(packed) -> np.ndarray:
+    return ((np.asarray(packed, dtype=np.uint32)[:, None] >> SHIFTS) & 31).astype(np.uint8)
+
+
+def sorted_words(words) -> np.ndarray:
+    # sorted and deduplicated, the order every pattern matrix is stored in
+    return unpack_words(np.unique(pack_words(words)))
+
+
+def feedback_to_code(feedback) -> int:
+    return int(sum(int(f) * 3 ** i for i, f in enumerate(feedback)))
+
+
+def is_feedback(feedback) -> bool:
+    # five digits of 0 / 1 / 2; a bad translation like [0, 0, 0, 0, 9] or [3, 0, 0, 0, 0] would overflow or alias a code
+    return len(feedback) == 5 and all(f in (0, 1, 2) for f in feedback)
+
+
+def code_to_feedback(code) -> list[int]:
+    return [int(code) // 3 ** i % 3 for i in range(5)]
+
+
+def query_res_all(ans: str, words) -> np.ndarray:
+    ans = np.array(list(ans), dtype='<U1')
+    words = np.array([list(word) for word in words], dtype='<U1')
+    N: int = words.shape[0]
+
+    not_greens = (ans != words) # (N, 5)
+
+    matches = (words[:, :, None] == ans[None, None, :]) # (N, 5, 5)
+    '''
+    matches[x][i][j]
+    x번째 단어의 i번째 문자와 답의 j번째 문자가 같은지 여부
+    '''
+    t = (matches & not_greens[:, None, :]).sum(axis=2) # (N, 5)
+
+    matches = (words[:, :, None] == words[:, None, :]) # (N, 5, 5)
+    '''
+    matches[x][i][j]
+    x번째 단어의 i번째 문자와 x번째 단어의 j번째 문자가 같은지 여부
+    '''
+    s = np.cumsum(matches & not_greens[:, None, :], axis=2)[np.arange(N)[:, None], np.arange(5), np.arange(5)] # (N, 5)
+
+    res = np.full_like(words, fill_value=2, dtype=int) # (N, 5)
+    res[not_greens] = (t >= s)[not_greens].astype(int)
+
+    res = (res * np.array([1, 3, 9, 27, 81])).sum(axis=1) # (N,)
+
+    return res
+
+
+# kernel working set is ~16 bytes per (guess, answer) pair
+# blocks that stay in cache are faster than big ones, 4MB was the sweet spot for 4000 x 4000
+DEFAULT_MEMORY_BUDGET = 4 * 2**20
+BYTES_PER_PAIR = 16
+POW3 = np.array([1, 3, 9, 27, 81], dtype=np.uint8)
+
+
+def _feedback_block(g: np.ndarray, a: np.ndarray, a_counts: np.ndarray) -> np.ndarray:
+    '''
+    g: (G, 5), a: (A, 5) letter codes, a_counts: (26, A) letter counts of a
+    t_i = (답에서 g[i] 문자의 개수) - (g[i]와 같은 문자인 초록 칸의 개수)
+    s_i = 1 + (i 앞에서 g[i]와 같은 문자이면서 초록이 아닌 칸의 개수)
+    노랑 = 초록이 아니고 t_i >= s_i
+    '''
+    greens = [g[:, i, None] == a[None, :, i] for i in range(5)] # 5 x (G, A)
+    same = g[:, :, None] == g[:, None, :] # (G, 5, 5), same[x][i][j]: x번째 guess의 i, j번째 문자가 같은지
+
+    res = np.zeros((g.shape[0], a.shape[0]), dtype=np.uint8)
+    for i in range(5):
+        slack = a_counts[g[:, i]].astype(np.int8) - 1 # t_i - s_i, without repeated-letter corrections
+        for j in range(5):
+            # most blocks have no guess repeating these two positions, so skip them entirely
+            if j == i or not same[:, i, j].any():
+                continue
+            rep = same[:, i, j, None]
+            if j < i:
+                slack -= rep & ~greens[j]
+            slack -= rep & greens[j]
+        res += POW3[i] * np.where(greens[i], np.uint8(2), (slack >= 0).astype(np.uint8))
+    return res
+
+
+def feedback_codes(guesses, answers, memory_budget=DEFAULT_MEMORY_BUDGET, out=None) -> np.ndarray:
+    '''
+    res[x][y] = guesses[x]를 질의했을 때 정답이 answers[y]라면 받는 피드백 코드 (uint8)
+    memory_budget 안에 들어가도록 guess x answer 블록 단위로 계산한다
+    '''
+    g = encode_words(guesses)
+    a = encode_words(answers)
+    G, A = g.shape[0], a.shape[0]
+    if out is None:
+        out = np.empty((G, A), dtype=np.uint8)
+
+    block_pairs = max(memory_budget // BYTES_PER_PAIR, 1)
+    block_a = min(A, block_pairs)
+    block_g = max(block_pairs // max(block_a, 1), 1)
+
+    for a0 in range(0, A, block_a):
+        a_block = a[a0:a0 + block_a]
+        a_counts = np.zeros((26, a_block.shape[0]), dtype=np.uint8)
+        for i in range(5):
+            np.add.at(a_counts, (a_block[:, i], np.arange(a_block.shape[0])), 1)
+        for g0 in range(0, G, block_g):
+            out[g0:g0 + block_g, a0:a0 + block_a] = _feedback_block(g[g0:g0 + block_g], a_block, a_counts)
+    return out
+
+
+# SWAR kernel: two answers per uint64 (bits 0-24 and 32-56), 5-bit letter lanes in pack_words order
+LANE_LOW = np.uint64(sum(1 << (5 * k) for k in range(5)) * (1 + (1 << 32)))
+# multiplying a lane-low mask by this sums each half's lanes into bits 20-24 / 52-56
+LANE_SUM = np.uint64(sum(1 << (5 * k) for k in range(5)))
+SUM_FIELDS = np.uint64((31 << 20) | (31 << 52))
+# t - s + 16 stays inside its 5-bit field and has bit 24 / 56 set exactly when t >= s
+SUM_BIAS = np.uint64((16 << 20) | (16 << 52))
+HALF_LOW = np.uint64(1 | (1 << 32))
+# lane-low bit of position i (first letter in the highest lane), in both halves
+POSITION_BITS = [np.uint64((1 << (5 * (4 - i))) * (1 + (1 << 32))) for i in range(5)]
+# positions 0..i
+PREFIX_BITS = [np.uint64(sum(int(POSITION_BITS[j]) for j in range(i + 1))) for i in range(5)]
+# two-answer words, the gathered letter masks and a few temporaries, per (guess, answer) pair
+SWAR_BYTES_PER_PAIR = 24
+
+
+def _zero_lanes(x) -> np.ndarray:
+    # lane-low bit set where the whole 5-bit lane is zero; shifts never reach the next lane's low bit
+    folded = x | (x >> np.uint64(1)) | (x >> np.uint64(2)) | (x >> np.uint64(3)) | (x >> np.uint64(4))
+    return ~folded & LANE_LOW
+
+
+def _lane_sums(mask) -> np.ndarray:
+    # number of lanes set in each half of a lane-low mask, in bits 20-24 / 52-56, with one multiply
+    return (mask * LANE_SUM) & SUM_FIELDS
+
+
+def swar_feedback_codes(guesses, answers, memory_budget=DEFAULT_MEMORY_BUDGET, out=None) -> np.ndarray:
+    '''
+    feedback_codes와 같은 결과 (t/s 규칙)를 pack된 단어의 비트 연산으로 구한다
+    - 초록: guess ^ answer에서 0인 lane
+    - t_i: answer에서 guess[i] 문자이면서 초록이 아닌 lane의 개수
+    - s_i: guess의 0..i번째 중 guess[i] 문자이면서 초록이 아닌 lane의 개수
+    uint64 하나에 정답 두 개를 넣어서 lane 연산 한 번이 두 쌍을 처리하고, lane 개수는 곱셈 한 번으로 센다
+    정답의 문자별 lane mask (26개)와 guess 쪽 s mask는 블록 밖에서 한 번만 만든다
+    '''
+    g = pack_words(guesses).astype(np.uint64)
+    a = pack_words(answers).astype(np.uint64)
+    G, A = len(g), len(a)
+    if out is None:
+        out = np.empty((G, A), dtype=np.uint8)
+    if A % 2:
+        a = np.append(a, a[-1:])
+    answer_pairs = a[0::2] | (a[1::2] << np.uint64(32))
+    guess_pairs = g | (g << np.uint64(32))
+
+    letters = [((g >> SHIFTS[i].astype(np.uint64)) & np.uint64(31)).astype(np.intp) for i in range(5)]
+    # letter_lanes[c] = lanes of each answer pair holding letter c
+    letter_lanes = _zero_lanes(answer_pairs[None, :] ^ (np.arange(26, dtype=np.uint64)[:, None] * LANE_LOW))
+    # same letter as position i among guess positions 0..i, green or not
+    guess_same = [_zero_lanes(guess_pairs ^ (letters[i].astype(np.uint64) * LANE_LOW)) & PREFIX_BITS[i] for i in range(5)]
+
+    block_pairs = max(memory_budget // SWAR_BYTES_PER_PAIR, 2)
+    block_a = min(len(answer_pairs), block_pairs // 2)
+    block_g = max(block_pairs // max(2 * block_a, 1), 1)
+
+    for a0 in range(0, len(answer_pairs), block_a):
+        ans = answer_pairs[None, a0:a0 + block_a]
+        lanes = letter_lanes[:, a0:a0 + block_a]
+        cols = slice(2 * a0, min(2 * (a0 + block_a), A))
+        for g0 in range(0, G, block_g):
+            rows = slice(g0, g0 + block_g)
+            non_green = LANE_LOW & ~_zero_lanes(guess_pairs[rows, None] ^ ans)
+            # feedback code of the low / high answer in bits 0-7 / 32-39
+            codes = np.zeros(non_green.shape, dtype=np.uint64)
+            for i in range(5):
+                t = _lane_sums(non_green & lanes[letters[i][rows]])
+                s = _lane_sums(non_green & guess_same[i][rows, None])
+                yellow = ((t + SUM_BIAS - s) >> np.uint64(24)) & HALF_LOW
+                green = (~non_green >> np.uint64(5 * (4 - i))) & HALF_LOW
+                codes += np.uint64(POW3[i]) * ((green << np.uint64(1)) | (yellow & ~green))
+            # little-endian bytes 0 and 4 are the two codes, already in answer order
+            block = codes.view(np.uint8).reshape(codes.shape[0], -1, 8)[:, :, [0, 4]].reshape(codes.shape[0], -1)
+            out[rows, cols] = block[:, :cols.stop - cols.start]
+    return out
+
+
+# pattern kernels with identical output; "swar" packs two answers per uint64 but its temporaries take ~24 bytes
+# per pair against numpy's ~16, and it measures slower here (~20M vs ~29M pairs/s), so numpy stays the default
+BACKENDS = {"numpy": feedback_codes, "swar": swar_feedback_codes}
+
+
+def fingerprint(words) -> str:
+    # the matrix is always stored in sorted word order, so the key ignores the order we received
+    return hashlib.sha1(np.unique(pack_words(words)).astype('<u4').tobytes()).hexdigest()[:20]
+
+
+def pattern_matrix_path(words, cache_dir=None) -> str:
+    return os.path.join(cache_dir or CACHE_DIR, f"{fingerprint(words)}.npy")
+
+
+# rows handed to one worker at a time, ~4M pairs per task keeps 32 workers busy on a 13k list
+TASK_PAIRS = 1 << 22
+
+_worker_words = None
+
+
+def _init_worker(words):
+    global _worker_words
+    _worker_words = words
+
+
+def _build_rows(task):
+    path, start, stop, backend = task
+    out = np.load(path, mmap_mode="r+")
+    BACKENDS[backend](_worker_words[start:stop], _worker_words, out=out[start:stop])
+    out.flush()
+    return stop - start
+
+
+def build_pattern_matrix(words, path=None, processes=1, backend="numpy") -> np.ndarray:
+    '''
+    processes > 1이면 guess 행들을 나눠서 프로세스 풀이 path의 memmap에 직접 쓴다
+    backend: BACKENDS의 커널 이름
+    '''
+    words = sorted_words(words)
+    N = words.shape[0]
+    if path is None:
+        out = np.empty((N, N), dtype=np.uint8)
+    else:
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(N, N))
+
+    if processes > 1 and path is not None:
+        import multiprocessing
+
+        rows = max(TASK_PAIRS // max(N, 1), 1)
+        tasks = [(path, start, min(start + rows, N), backend) for start in range(0, N, rows)]
+        out.flush()
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(words,)) as pool:
+            for _ in pool.imap_unordered(_build_rows, tasks):
+                pass
+    else:
+        BACKENDS[backend](words, words, out=out)
+
+    if path is not None:
+        out.flush()
+    return out
+
+
+def load_pattern_matrix(words, build=True, cache_dir=None, processes=1, backend="numpy"):
+    '''
+    정렬된 words 기준의 (N, N) uint8 행렬을 memmap으로 연다.
+    캐시에 없고 build=False면 None
+    '''
+    path = pattern_matrix_path(words, cache_dir)
+    if not os.path.exists(path):
+        if not build:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a private file first so a concurrent loader never sees a half-built matrix
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        build_pattern_matrix(words, path=tmp_path, processes=processes, backend=backend)
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    # precompute: python patterns.py words.txt --processes 32
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="build the cached pattern matrix for a word list")
+    parser.add_argument("word_file", nargs="?", default="words.txt")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the list is already cached")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="numpy")
+    args = parser.parse_args()
+
+    words = encode_words(open(args.word_file).read().strip().split('\n'))
+    path = pattern_matrix_path(words, args.cache_dir)
+    if args.force and os.path.exists(path):
+        os.remove(path)
+
+    if os.path.exists(path):
+        print(f"{path}: already cached")
+    else:
+        start_time = time.time()
+        matrix = load_pattern_matrix(words, cache_dir=args.cache_dir, processes=args.processes, backend=args.backend)
+        elapsed = time.time() - start_time
+        print(f"{path}: {matrix.shape} in {elapsed:.2f}s, {matrix.size / elapsed:,.0f} pairs/s ({args.processes} processes, {args.backend})")
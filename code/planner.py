@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from patterns import CACHE_DIR, encode_words, feedback_codes, load_pattern_matrix, sorted_words
+from scoring import BucketHistograms, best_guess, letter_frequency_scores, sampled_guess, score_counts, two_ply_entropy, two_stage_guess
+from search import BEAM_BRANCH, BEAM_LIMIT, EXACT_LIMIT, MINIMAX_BRANCH, MINIMAX_LIMIT, ExactSolver, MinimaxSolver, minimax_guess
+
+# host-specific, shared by every word list
+COST_MODEL_PATH = os.path.join(CACHE_DIR, "cost_model.json")
+
+
+class GuessStrategy(NamedTuple):
+    name: str
+    quality: int # 클수록 좋은 guess, planner는 예산 안에 드는 것 중 가장 큰 것을 고른다
+    share: float # 턴 예산 중 쓸 수 있는 비율, timeout이 나는 탐색은 나머지를 다음 전략에 남긴다
+    work: Callable # work(N, S, k) -> (guess, answer) 쌍의 개수, 단어 N개 / plausible S개 / 전략의 k (lookahead 후보, two-stage top-k)
+
+
+GUESS_STRATEGIES = {}
+
+
+def register_strategy(name, quality, share, work) -> GuessStrategy:
+    GUESS_STRATEGIES[name] = GuessStrategy(name, quality, share, work)
+    return GUESS_STRATEGIES[name]
+
+
+def _pool(N, S):
+    # _PoolSearch: every word if the codes fit in pool_pairs, otherwise the top 300 plus the plausibles
+    return N if N * S <= 1_000_000 else min(N, 300 + S)
+
+
+# the optimum over every word; the beam (top-300 pool, BEAM_BRANCH per node) is a heuristic, on par with lookahead
+register_strategy("exact", 4, 0.5, lambda N, S, k: N * S)
+register_strategy("beam", 3, 0.5, lambda N, S, k: _pool(N, S) * S)
+register_strategy("minimax", 4, 0.5, lambda N, S, k: (_pool(N, S) if S <= MINIMAX_LIMIT else N) * S)
+register_strategy("lookahead", 3, 1.0, lambda N, S, k: max(k, 1) * N * S)
+register_strategy("entropy", 2, 1.0, lambda N, S, k: N * S)
+# large lists: exact entropy on the heuristic's top k only, no bound pruning; the heuristic pass over N goes in a
+register_strategy("two_stage", 2, 0.5, lambda N, S, k: max(k, 1) * S)
+# sampled_guess usually stops long before S x S, the calibrated cost per pair absorbs that
+register_strategy("sampled", 1, 1.0, lambda N, S, k: S * S)
+register_strategy("heuristic", 0, 1.0, lambda N, S, k: N + S)
+
+# (a, c) of seconds = a + c * pairs, fitted by calibrate() on the dev box; calibrate on the host to replace them
+DEFAULT_FITS = {
+    "exact:matrix": (0.0, 3.4e-5),
+    "exact:kernel": (0.0, 3.3e-5),
+    "beam:matrix": (0.055, 6.9e-7),
+    "beam:kernel": (0.0, 7.7e-7),
+    "minimax:matrix": (0.18, 1.6e-7),
+    "minimax:kernel": (0.11, 7.5e-8),
+    "lookahead:matrix": (0.71, 5.8e-7),
+    "lookahead:kernel": (0.61, 6.3e-7),
+    "entropy:matrix": (0.014, 8.3e-10),
+    "entropy:kernel": (0.02, 1e-9),
+    "two_stage:matrix": (0.075, 8.5e-9),
+    "two_stage:kernel": (0.0, 4.3e-8),
+    "sampled:matrix": (0.001, 1.6e-8),
+    "sampled:kernel": (0.002, 2.1e-8),
+    "heuristic:matrix": (0.01, 0.0),
+    "heuristic:kernel": (0.01, 0.0),
+}
+
+
+def _key(name, matrix):
+    return f"{name}:{'matrix' if matrix else 'kernel'}"
+
+
+class CostModel:
+    '''
+    전략마다 예상 실행 시간 = a + c * (work 쌍의 개수), pattern matrix가 있을 때와 없을 때를 따로 둔다
+    a는 준비 비용 (점수 행 준비, pool 고르기), c는 가지치기까지 반영된 쌍당 비용
+    '''
+
+    def __init__(self, fits=None):
+        self.fits = {**DEFAULT_FITS, **(fits or {})}
+
+    def predict(self, name, N, S, matrix, k=0) -> float:
+        a, c = self.fits[_key(name, matrix)]
+        return a + c * GUESS_STRATEGIES[name].work(N, S, k)
+
+    def largest_k(self, name, N, S, budget, matrix) -> int:
+        '''
+        work가 k에 비례하는 전략 (two_stage)에서 예상 시간이 budget 안에 드는 가장 큰 k
+        '''
+        a, c = self.fits[_key(name, matrix)]
+        per_k = c * GUESS_STRATEGIES[name].work(N, S, 1)
+        return N if per_k <= 0 else int(min(max((budget - a) / per_k, 0), N))
+
+    def plan(self, names, N, S, budget, matrix, ks=None):
+        '''
+        names 중 예상 시간이 budget * share 안에 드는 가장 좋은 전략, 하나도 없으면 가장 싼 전략
+        ks: {strategy name: k} (lookahead 후보 수, two_stage의 가장 작은 k)
+        returns (strategy name, predicted seconds)
+        '''
+        ks = ks or {}
+        ranked = sorted(names, key=lambda name: -GUESS_STRATEGIES[name].quality)
+        predicted = {name: self.predict(name, N, S, matrix, ks.get(name, 0)) for name in ranked}
+        for name in ranked:
+            if predicted[name] <= budget * GUESS_STRATEGIES[name].share:
+                return name, predicted[name]
+        cheapest = min(ranked, key=predicted.get)
+        return cheapest, predicted[cheapest]
+
+
+def load_cost_model(path=None) -> CostModel:
+    path = path or COST_MODEL_PATH
+    if not os.path.exists(path):
+        return CostModel()
+    with open(path) as f:
+        return CostModel({key: tuple(fit) for key, fit in json.load(f).items()})
+
+
+def save_cost_model(fits, path=None):
+    path = path or COST_MODEL_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({key: list(fit) for key, fit in fits.items()}, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _sample_state(words, patterns, rng, size):
+    '''
+    실제 게임처럼 임의의 guess에 임의의 정답이 주는 bucket으로 계속 좁혀서, plausible이 size 이하가 되면 돌려준다
+    size / 4보다 작아지는 bucket은 (몇 번까지) 다른 guess로 다시 뽑아서 크기를 고루 얻는다
+    '''
+    S = np.arange(len(words))
+    tries = 0
+    while len(S) > size:
+        guess = rng.integers(len(words))
+        if patterns is not None:
+            codes = np.asarray(patterns[guess][S])
+        else:
+            codes = feedback_codes(words[[guess]], words[S])[0]
+        bucket = S[codes == codes[rng.integers(len(S))]]
+        tries += 1
+        if len(bucket) > 1 and (len(bucket) >= size // 4 or tries > 50):
+            S, tries = bucket, 0
+    return S
+
+
+def _run(name, words, patterns, S, rng, ks):
+    N = len(words)
+    histograms = BucketHistograms(words, patterns)
+    histograms.restrict(S)
+    start_time = time.time()
+    if name == "exact":
+        ExactSolver(words, patterns, pool_pairs=None).best(S)
+    elif name == "beam":
+        ExactSolver(words, patterns, branch=BEAM_BRANCH).best(S)
+    elif name == "minimax":
+        minimax_guess(words, S, histograms, MinimaxSolver(words, patterns, branch=MINIMAX_BRANCH))
+    elif name == "lookahead":
+        entropy = score_counts(histograms.rows(np.arange(N))).entropy
+        two_ply_entropy(np.argsort(-entropy, kind="stable")[:ks["lookahead"]], np.arange(N), S, words, patterns)
+    elif name == "entropy":
+        best_guess(np.arange(N), S, words, histograms.rows)
+    elif name == "two_stage":
+        two_stage_guess(np.arange(N), S, words, histograms.rows, k=ks["two_stage"])
+    elif name == "sampled":
+        sampled_guess(S, S, words, rng, patterns)
+    elif name == "heuristic":
+        letter_frequency_scores(np.arange(N), S, words)
+    return time.time() - start_time
+
+
+def calibrate(words, patterns=None, names=None, sizes=(25, 50, 100, 200, 400, 800, 1600, 3200, 6400, 12800),
+              repeats=3, ks=None, max_seconds=5.0, seed=0) -> dict:
+    '''
+    전략마다 실제 게임 상태 크기별로 돌려 보고 시간 = a + c * 쌍을 (음수가 되지 않게) 최소제곱으로 맞춘다
+    exact / beam / minimax는 EXACT_LIMIT / BEAM_LIMIT / MINIMAX_LIMIT 이하에서만, 한 번이 max_seconds를 넘으면 더 큰 크기는 건너뛴다
+    returns {"name:matrix" or "name:kernel": (a, c)}
+    '''
+    rng = np.random.default_rng(seed)
+    N = len(words)
+    # two_stage at full k: the per-pair cost grows with the tile, so fit it where the solver runs it
+    ks = {"lookahead": 4, "two_stage": N, **(ks or {})}
+    fits = {}
+    for name in names or GUESS_STRATEGIES:
+        limit = {"exact": EXACT_LIMIT, "beam": BEAM_LIMIT, "minimax": MINIMAX_LIMIT}.get(name, N)
+        samples = []
+        for size in sizes:
+            if size > limit:
+                break
+            seconds = 0
+            for _ in range(repeats):
+                S = _sample_state(words, patterns, rng, size)
+                seconds = _run(name, words, patterns, S, rng, ks)
+                samples.append((GUESS_STRATEGIES[name].work(N, len(S), ks.get(name, 0)), seconds))
+            if seconds > max_seconds:
+                break
+        pairs, seconds = np.array(samples, dtype=np.float64).T
+        if len(np.unique(pairs)) < 2:
+            continue
+        c, a = np.polyfit(pairs, seconds, 1)
+        # a noisy set of small runs can tilt the line below zero at either end
+        c = max(float(c), 0.0)
+        a = max(float(np.mean(seconds - c * pairs)), 0.0)
+        fits[_key(name, patterns is not None)] = (a, c)
+    return fits
+
+
+if __name__ == "__main__":
+    # python planner.py words.txt
+    import argparse
+
+    parser = argparse.ArgumentParser(description="time every guess strategy on this host and store the cost model")
+    parser.add_argument("word_file", nargs="?", default="words.txt")
+    parser.add_argument("--strategies", nargs="+", choices=sorted(GUESS_STRATEGIES), default=None)
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="stop growing a strategy's states past this")
+    parser.add_argument("--path", default=None)
+    args = parser.parse_args()
+
+    words = sorted_words(encode_words(open(args.word_file).read().strip().split('\n')))
+    patterns = load_pattern_matrix(words, build=False)
+    fits = {}
+    # with and without the pattern matrix, the solver meets both
+    for matrix in ([patterns, None] if patterns is not None else [None]):
+        fits.update(calibrate(words, matrix, args.strategies, max_seconds=args.max_seconds))
+    model = load_cost_model(args.path)
+    model.fits.update(fits)
+    save_cost_model(model.fits, args.path)
+    for key, (a, c) in sorted(fits.items()):
+        print(f"{key:>18}: {a:.3g}s + {c:.3g}s * pairs")
+    print(f"saved to {args.path or COST_MODEL_PATH}")
@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from patterns import DEFAULT_MEMORY_BUDGET, POW3, code_to_feedback, decode_words, encode_words, feedback_codes, sorted_words
+
+
+class FeedbackRule(NamedTuple):
+    name: str
+    reference: Callable # reference(guess: str, answer: str) -> list[int], 한 쌍씩 읽기 쉽게
+    batch: Callable # batch(guesses, answers, out=None) -> (G, A) uint8 codes
+    same_as: str = None # 모든 쌍에서 같은 코드를 주는 규칙, 솔버는 그 규칙의 캐시 (matrix / book / tree)를 그대로 쓴다
+
+
+RULES = {}
+# the rule every cached pattern matrix, book and tree is built with
+KERNEL_RULE = "ts"
+
+
+def register_rule(name, reference, batch, same_as=None) -> FeedbackRule:
+    RULES[name] = FeedbackRule(name, reference, batch, same_as)
+    return RULES[name]
+
+
+def get_rule(name) -> FeedbackRule:
+    if name not in RULES:
+        raise ValueError(f"unknown feedback rule {name!r}, expected one of {sorted(RULES)}")
+    return RULES[name]
+
+
+def ts_reference(guess: str, answer: str) -> list[int]:
+    '''
+    src/py/query.py의 규칙: 초록이 아닌 i번째 칸은 t >= s이면 노랑
+    t = 답에서 guess[i]와 같은 문자이면서 초록이 아닌 칸의 개수
+    s = guess의 0..i번째 칸 중 guess[i]와 같은 문자이면서 초록이 아닌 칸의 개수
+    '''
+    res = [2, 2, 2, 2, 2]
+    for i, c in enumerate(guess):
+        if answer[i] != c:
+            t = sum(1 for j in range(5) if answer[j] == c and answer[j] != guess[j])
+            s = sum(1 for j in range(i + 1) if guess[j] == c and answer[j] != guess[j])
+            res[i] = int(t >= s)
+    return res
+
+
+def two_pass_reference(guess: str, answer: str) -> list[int]:
+    '''
+    grader의 규칙: 먼저 초록을 다 표시하고, 남은 답 문자들을 왼쪽부터 노랑에 하나씩 쓴다
+    '''
+    feedback = [0] * 5
+    answer_chars = list(answer)
+    guess_chars = list(guess)
+
+    for i in range(5):
+        if guess_chars[i] == answer_chars[i]:
+            feedback[i] = 2
+            answer_chars[i] = None
+            guess_chars[i] = None
+
+    remaining = {}
+    for ch in answer_chars:
+        if ch:
+            remaining[ch] = remaining.get(ch, 0) + 1
+
+    for i in range(5):
+        if guess_chars[i] and remaining.get(guess_chars[i], 0) > 0:
+            feedback[i] = 1
+            remaining[guess_chars[i]] -= 1
+    return feedback
+
+
+# greens + per-letter remaining counts of the answer + indexing temporaries
+TWO_PASS_BYTES_PER_PAIR = 64
+
+
+def two_pass_codes(guesses, answers, memory_budget=DEFAULT_MEMORY_BUDGET, out=None) -> np.ndarray:
+    '''
+    two_pass_reference를 (guess, answer) 블록 단위로 그대로 벡터화한 것
+    remaining[x][y][c] = 초록을 빼고 answers[y]에 남은 문자 c의 개수, 왼쪽부터 노랑에 쓸 때마다 하나씩 뺀다
+    '''
+    g = encode_words(guesses)
+    a = encode_words(answers)
+    G, A = g.shape[0], a.shape[0]
+    if out is None:
+        out = np.empty((G, A), dtype=np.uint8)
+
+    block_pairs = max(memory_budget // TWO_PASS_BYTES_PER_PAIR, 1)
+    block_a = min(A, block_pairs)
+    block_g = max(block_pairs // max(block_a, 1), 1)
+
+    for a0 in range(0, A, block_a):
+        a_block = a[a0:a0 + block_a]
+        cols = np.arange(a_block.shape[0])[None, :]
+        for g0 in range(0, G, block_g):
+            g_block = g[g0:g0 + block_g]
+            rows = np.arange(g_block.shape[0])[:, None]
+            greens = g_block[:, None, :] == a_block[None, :, :] # (G, A, 5)
+
+            remaining = np.zeros((g_block.shape[0], a_block.shape[0], 26), dtype=np.uint8)
+            for j in range(5):
+                remaining[rows, cols, a_block[None, :, j]] += ~greens[:, :, j]
+
+            res = np.zeros(greens.shape[:2], dtype=np.uint8)
+            for i in range(5):
+                letter = g_block[:, i, None]
+                yellow = ~greens[:, :, i] & (remaining[rows, cols, letter] > 0)
+                remaining[rows, cols, letter] -= yellow
+                res += POW3[i] * np.where(greens[:, :, i], np.uint8(2), yellow.astype(np.uint8))
+            out[g0:g0 + block_g, a0:a0 + block_a] = res
+    return out
+
+
+# the pattern kernel is the letter-count form of the t/s rule
+register_rule("ts", ts_reference, feedback_codes)
+# yellow iff t >= s is the left-to-right handout of the non-green letters, so the two rules agree on every pair
+# (check_rules keeps comparing the batches); two_pass_codes is ~10x slower than the kernel
+register_rule("two_pass", two_pass_reference, two_pass_codes, same_as=KERNEL_RULE)
+
+
+# guess rows one worker checks at a time
+CHECK_ROWS = 16
+
+_worker_words = None
+
+
+def _init_worker(words):
+    global _worker_words
+    _worker_words = (words, decode_words(words))
+
+
+def _check_rows(task):
+    '''
+    rows start..stop의 모든 쌍에서 reference와 batch를 비교한다
+    returns [(rule, guess, answer, reference feedback, batch feedback)] for every mismatch
+    '''
+    name, start, stop = task
+    rule = get_rule(name)
+    words, text = _worker_words
+    batch = rule.batch(words[start:stop], words)
+    mismatches = []
+    for x in range(start, stop):
+        for y in range(len(words)):
+            expected = rule.reference(text[x], text[y])
+            got = code_to_feedback(batch[x - start, y])
+            if got != expected:
+                mismatches.append((name, text[x], text[y], expected, got))
+    return mismatches
+
+
+def check_rules(words, names=None, processes=1) -> list:
+    '''
+    단어 목록의 모든 (guess, answer) 쌍에서
+    - 규칙마다 scalar reference와 batch 구현이 같은지
+    - 규칙끼리 batch 결과가 같은지 (다르면 솔버와 grader가 다른 피드백을 보게 된다)
+    를 확인하고 어긋난 쌍들을 돌려준다. reference 비교는 guess 행을 나눠서 프로세스 풀로 돌린다
+    '''
+    words = sorted_words(words)
+    names = names or sorted(RULES)
+    N = len(words)
+    tasks = [(name, start, min(start + CHECK_ROWS, N)) for name in names for start in range(0, N, CHECK_ROWS)]
+
+    mismatches = []
+    if processes > 1:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(words,)) as pool:
+            for found in pool.imap_unordered(_check_rows, tasks):
+                mismatches += found
+    else:
+        _init_worker(words)
+        for task in tasks:
+            mismatches += _check_rows(task)
+
+    # batch against batch is cheap, compare whole row blocks
+    text = decode_words(words)
+    block = max(DEFAULT_MEMORY_BUDGET // max(N, 1), 1)
+    for start in range(0, N, block):
+        codes = {name: get_rule(name).batch(words[start:start + block], words) for name in names}
+        for other in names[1:]:
+            for x, y in zip(*np.nonzero(codes[names[0]] != codes[other])):
+                mismatches.append((f"{names[0]}/{other}", text[start + x], text[y],
+                                   code_to_feedback(codes[names[0]][x, y]), code_to_feedback(codes[other][x, y])))
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python rules.py words.txt --processes 32
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="check every feedback rule over all pairs of a word list")
+    parser.add_argument("word_file", nargs="?", default="words.txt")
+    parser.add_argument("--rules", nargs="+", choices=sorted(RULES), default=None)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    words = sorted_words(encode_words(open(args.word_file).read().strip().split('\n')))
+    start_time = time.time()
+    mismatches = check_rules(words, args.rules, args.processes)
+    for mismatch in mismatches[:20]:
+        print(*mismatch)
+    print(f"{len(words)}^2 pairs, rules {args.rules or sorted(RULES)}: {len(mismatches)} mismatches in {time.time() - start_time:.2f}s")
@@ -0,0 +1,386 @@
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from patterns import feedback_codes
+
+NUM_CODES = 243
+DEFAULT_RAM_CAP = 256 * 2**20
+# uint8 code tile + kernel temporaries + the int64 index bincount needs
+STREAM_BYTES_PER_PAIR = 32
+
+
+def bucket_counts(guess_idx, ans_idx, words, patterns=None, ram_cap=DEFAULT_RAM_CAP) -> np.ndarray:
+    '''
+    counts[x][code] = guess_idx[x]번째 단어를 질의했을 때 ans_idx 중 code를 받는 정답의 개수
+    (guess tile x answer tile) 코드를 고정 크기 버퍼에 만들고 바로 히스토그램에 더하므로
+    전체 (G, A) 코드 행렬을 메모리에 올리지 않는다
+    '''
+    guess_idx = np.asarray(guess_idx)
+    ans_idx = np.asarray(ans_idx)
+    G, A = len(guess_idx), len(ans_idx)
+    counts = np.zeros((G, NUM_CODES), dtype=np.int32)
+    if G == 0 or A == 0:
+        return counts
+
+    tile_pairs = max((ram_cap - counts.nbytes) // STREAM_BYTES_PER_PAIR, NUM_CODES)
+    tile_a = min(A, tile_pairs)
+    tile_g = min(G, max(tile_pairs // tile_a, 1))
+    scratch = np.empty(tile_g * tile_a, dtype=np.uint8)
+    offsets = (np.arange(tile_g, dtype=np.intp) * NUM_CODES)[:, None]
+
+    for a0 in range(0, A, tile_a):
+        a_idx = ans_idx[a0:a0 + tile_a]
+        a_words = words[a_idx]
+        for g0 in range(0, G, tile_g):
+            g_idx = guess_idx[g0:g0 + tile_g]
+            g, a = len(g_idx), len(a_idx)
+            tile = scratch[:g * a].reshape(g, a)
+            if patterns is not None:
+                tile[...] = patterns[np.ix_(g_idx, a_idx)]
+            else:
+                feedback_codes(words[g_idx], a_words, out=tile)
+            counts[g0:g0 + g] += np.bincount((tile + offsets[:g]).ravel(), minlength=g * NUM_CODES).reshape(g, NUM_CODES).astype(np.int32)
+    return counts
+
+
+_row_hash = np.zeros(0, dtype=np.uint64)
+
+
+def _hash_weights(n) -> np.ndarray:
+    # fixed odd 64-bit multipliers, shared by every problem and grown on demand
+    global _row_hash
+    if len(_row_hash) < n:
+        rng = np.random.default_rng(len(_row_hash))
+        extra = rng.integers(1, 2**63, size=max(n, 2 * len(_row_hash)) - len(_row_hash), dtype=np.uint64)
+        _row_hash = np.concatenate([_row_hash, extra | np.uint64(1)])
+    return _row_hash[:n]
+
+
+def _row_keys(codes):
+    '''
+    returns (hash of each code row, whether the row splits the answers at all)
+    '''
+    keys = (codes.astype(np.uint64) * _hash_weights(codes.shape[1])).sum(axis=1, dtype=np.uint64)
+    splits = (codes != codes[:, :1]).any(axis=1)
+    return keys, splits
+
+
+def distinct_rows(codes) -> np.ndarray:
+    '''
+    같은 코드 행 (= 같은 partition) 중 첫 번째만, 그리고 정답들을 나누지 못하는 행은 빼고 남긴 행 번호 (오름차순)
+    행은 64-bit 해시로 비교한다 (충돌은 무시)
+    '''
+    keys, splits = _row_keys(codes)
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    return first[splits[first]]
+
+
+def distinct_guesses(guess_idx, ans_idx, words, patterns=None, ram_cap=DEFAULT_RAM_CAP) -> np.ndarray:
+    '''
+    scoring 전에 guess_idx를 줄인다: ans_idx 위의 코드 행이 같은 guess들은 점수도 같으므로 앞의 하나만,
+    모든 정답에 같은 코드를 주는 guess는 아무것도 알려주지 않으므로 버린다
+    pattern matrix가 없으면 코드를 만드는 비용이 scoring과 같으므로 그대로 돌려준다
+    '''
+    guess_idx = np.asarray(guess_idx)
+    ans_idx = np.asarray(ans_idx)
+    if patterns is None or len(ans_idx) < 2:
+        return guess_idx
+    G, A = len(guess_idx), len(ans_idx)
+    keys = np.empty(G, dtype=np.uint64)
+    splits = np.empty(G, dtype=bool)
+    tile_g = max(ram_cap // (A * STREAM_BYTES_PER_PAIR), 1)
+    for g0 in range(0, G, tile_g):
+        keys[g0:g0 + tile_g], splits[g0:g0 + tile_g] = _row_keys(np.asarray(patterns[np.ix_(guess_idx[g0:g0 + tile_g], ans_idx)]))
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    return guess_idx[first[splits[first]]]
+
+
+class GuessScores(NamedTuple):
+    entropy: np.ndarray # bits of information from the feedback
+    expected_size: np.ndarray # expected number of answers left afterwards
+    max_bucket: np.ndarray # answers left in the worst case
+    singletons: np.ndarray # feedback codes that pin down the answer
+
+
+_nlogn = np.zeros(1)
+
+
+def nlogn_table(n) -> np.ndarray:
+    '''
+    table[k] = k * log2(k), 0 * log2(0) = 0. 모든 문제가 공유하며 필요할 때만 늘린다
+    '''
+    global _nlogn
+    if len(_nlogn) <= n:
+        k = np.arange(max(n + 1, 2 * len(_nlogn)), dtype=np.float64)
+        table = np.zeros_like(k)
+        table[1:] = k[1:] * np.log2(k[1:])
+        _nlogn = table
+    return _nlogn
+
+
+def score_counts(counts) -> GuessScores:
+    '''
+    counts[x][code]만으로 정수 연산 + lookup으로 모든 지표를 한 번에 구한다
+    H = log2(n) - sum(c * log2(c)) / n,  E[size] = sum(c^2) / n
+    '''
+    n = counts.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    table = nlogn_table(int(counts.max(initial=0)))
+    entropy = np.log2(safe_n) - table[counts].sum(axis=1) / safe_n
+    expected_size = (counts.astype(np.int64) ** 2).sum(axis=1) / safe_n
+    return GuessScores(
+        entropy=entropy,
+        expected_size=expected_size,
+        max_bucket=counts.max(axis=1),
+        singletons=(counts == 1).sum(axis=1),
+    )
+
+
+def score_guesses(guess_idx, ans_idx, words, patterns=None, ram_cap=DEFAULT_RAM_CAP) -> GuessScores:
+    return score_counts(bucket_counts(guess_idx, ans_idx, words, patterns, ram_cap))
+
+
+class BucketHistograms:
+    '''
+    guess별 counts[g][code]를 턴을 넘어 들고 다닌다. 실제로 계산한 행만 valid
+    새 plausible 집합은 항상 이전 집합의 부분집합이므로, 지워진 정답만 빼거나 (더 쌀 때) 다음에 필요할 때 다시 센다
+    '''
+
+    def __init__(self, words, patterns=None, ram_cap=DEFAULT_RAM_CAP):
+        self.words = words
+        self.patterns = patterns
+        self.ram_cap = ram_cap
+        self.counts = np.zeros((len(words), NUM_CODES), dtype=np.int32)
+        self.valid = np.zeros(len(words), dtype=bool)
+        self.ans_idx = np.arange(len(words))
+
+    def restrict(self, ans_idx):
+        eliminated = np.setdiff1d(self.ans_idx, ans_idx, assume_unique=True)
+        rows = np.flatnonzero(self.valid)
+        if len(eliminated) and len(rows):
+            if len(eliminated) < len(ans_idx):
+                self.counts[rows] -= bucket_counts(rows, eliminated, self.words, self.patterns, self.ram_cap)
+            else:
+                self.valid[:] = False
+        self.ans_idx = ans_idx
+
+    def rows(self, guess_idx) -> np.ndarray:
+        guess_idx = np.asarray(guess_idx)
+        missing = guess_idx[~self.valid[guess_idx]]
+        if len(missing):
+            self.counts[missing] = bucket_counts(missing, self.ans_idx, self.words, self.patterns, self.ram_cap)
+            self.valid[missing] = True
+        return self.counts[guess_idx]
+
+
+def _binary_entropy(p) -> np.ndarray:
+    p = np.clip(p, 0, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+    return np.nan_to_num(h)
+
+
+def _letter_frequencies(a):
+    '''
+    position[i][c] = i번째 글자가 c인 정답 비율, present[c] = c를 포함하는 정답 비율
+    '''
+    n = max(len(a), 1)
+    position = np.stack([np.bincount(a[:, i], minlength=26) for i in range(5)]) / n # (5, 26)
+    present = (a[:, :, None] == np.arange(26, dtype=np.uint8)).any(axis=1).sum(axis=0) / n # (26,)
+    return position, present
+
+
+def letter_frequency_scores(guess_idx, ans_idx, words) -> np.ndarray:
+    '''
+    위치별 글자 빈도만으로 매기는 싼 점수: 칸마다 (초록, 노랑, 회색) 확률을 따로 어림잡아 그 엔트로피를 더한다
+    초록 = i번째 글자가 guess[i]인 비율, 노랑 = guess[i]를 포함하는 비율 - 초록 (같은 글자는 처음 칸만)
+    칸들이 독립이 아니므로 정확한 엔트로피는 아니지만 순서는 잘 맞는다
+    '''
+    g = words[np.asarray(guess_idx)]
+    position, present = _letter_frequencies(words[np.asarray(ans_idx)])
+    first = np.ones(g.shape, dtype=bool)
+    for i in range(1, 5):
+        first[:, i] = ~(g[:, :i] == g[:, i, None]).any(axis=1)
+
+    p2 = position[np.arange(5), g]
+    p1 = np.clip(present[g] - p2, 0, 1) * first
+    p0 = np.clip(1 - p1 - p2, 0, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -sum(np.nan_to_num(p * np.log2(p)) for p in (p0, p1, p2))
+    return h.sum(axis=1)
+
+
+def entropy_upper_bounds(guess_idx, ans_idx, words) -> np.ndarray:
+    '''
+    H(F) <= sum_i H(F_i) 이고, i번째 칸의 피드백 F_i는
+    P(F_i = 2) = (i번째 글자가 guess[i]인 정답 비율), P(F_i >= 1) <= (guess[i]를 포함하는 정답 비율)
+    이므로 F_i의 엔트로피는 위 두 값만으로 위에서 bound 된다. 전체는 log2(정답 수)로도 bound
+    '''
+    g = words[np.asarray(guess_idx)]
+    n = max(len(ans_idx), 1)
+    position, present = _letter_frequencies(words[np.asarray(ans_idx)])
+
+    p2 = position[np.arange(5), g] # (G, 5)
+    p1 = np.maximum(present[g] - p2, 0)
+    rest = 1 - p2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        split = np.where(rest > 0, np.minimum(p1 / rest, 0.5), 0)
+    bound = (_binary_entropy(p2) + rest * _binary_entropy(split)).sum(axis=1)
+    return np.minimum(bound, np.log2(n))
+
+
+def two_stage_guess(guess_idx, ans_idx, words, rows, bonus=None, k=512, batch=256, deadline=None, cancel=None):
+    '''
+    letter_frequency_scores 상위 k개만 정확한 엔트로피로 다시 매긴다
+    batch씩 heuristic 순서대로 매기고, best_guess처럼 deadline이 지나거나 cancel이 set되면 첫 batch 이후 멈춘다
+    rows(guess_idx) -> counts, bonus[x]는 guess_idx[x]의 점수에 더해진다
+    returns (best guess, its score, positions in guess_idx of the top k by the heuristic that were scored)
+    '''
+    guess_idx = np.asarray(guess_idx)
+    bonus = np.zeros(len(guess_idx)) if bonus is None else np.asarray(bonus)
+    heuristic = letter_frequency_scores(guess_idx, ans_idx, words) + bonus
+    top = np.argsort(-heuristic, kind="stable")[:k]
+    scores = []
+    for start in range(0, len(top), batch):
+        if start and ((deadline is not None and time.time() > deadline) or (cancel is not None and cancel.is_set())):
+            break
+        pos = top[start:start + batch]
+        scores.append(score_counts(rows(guess_idx[pos])).entropy + bonus[pos])
+    scores = np.concatenate(scores)
+    top = top[:len(scores)]
+    # ties go to the earlier guess, same as best_guess
+    best = top[np.lexsort((top, -scores))[0]]
+    return guess_idx[best], scores.max(), top
+
+
+def best_guess(guess_idx, ans_idx, words, rows, bonus=None, batch=256, deadline=None, cancel=None):
+    '''
+    bound가 큰 guess부터 batch씩 정확한 엔트로피를 계산하고,
+    남은 guess의 bound가 지금까지의 최고 점수보다 작아지면 멈춘다 (전부 계산했을 때와 같은 guess를 고른다)
+    deadline (time.time() 기준)이 지나거나 cancel (threading.Event)이 set되면 첫 batch 이후 언제든 지금까지의 최선을 돌려준다
+    rows(guess_idx) -> counts, bonus[x]는 guess_idx[x]의 점수에 더해진다
+    returns (best guess, its score, number of guesses evaluated, whether the bound cutoff was reached)
+    '''
+    guess_idx = np.asarray(guess_idx)
+    bonus = np.zeros(len(guess_idx)) if bonus is None else np.asarray(bonus)
+    # small slack so rounding in the exact entropy never beats its own bound
+    bounds = entropy_upper_bounds(guess_idx, ans_idx, words) + bonus + 1e-9
+    order = np.argsort(-bounds, kind="stable")
+
+    best_pos, best_score = None, -np.inf
+    evaluated, complete = 0, True
+    while evaluated < len(order) and bounds[order[evaluated]] >= best_score:
+        if evaluated and ((deadline is not None and time.time() > deadline) or (cancel is not None and cancel.is_set())):
+            complete = False
+            break
+        pos = order[evaluated:evaluated + batch]
+        evaluated += len(pos)
+        scores = score_counts(rows(guess_idx[pos])).entropy + bonus[pos]
+        for p, s in zip(pos, scores):
+            # ties go to the earlier guess, same as argmax over everything
+            if s > best_score or (s == best_score and p < best_pos):
+                best_pos, best_score = p, s
+    return guess_idx[best_pos], best_score, evaluated, complete
+
+
+def sampled_guess(guess_idx, ans_idx, words, rng, patterns=None, ram_cap=DEFAULT_RAM_CAP,
+                  first=256, growth=2, z=3.0, deadline=None):
+    '''
+    ans_idx를 rng로 섞은 순서대로 라운드마다 first, first * growth, ... 개까지 정답 표본을 늘리며 엔트로피를 추정한다
+    - 추정: 표본 bucket 크기의 plug-in 엔트로피 + Miller-Madow 보정 (m - 1) / (2n ln 2), m = 비어 있지 않은 bucket 수
+    - 신뢰구간: z * sqrt(Var / n * (A - n) / (A - 1)),  Var = sum p (log2 p)^2 - H^2 (비복원 추출이라 n = A이면 폭 0), 보정량만큼 더 넓힌다
+    - 상한이 1등의 하한보다 낮은 guess는 버리고, 하나만 남거나 표본이 ans_idx 전체가 되면 멈춘다
+    deadline이 지나거나 다음 라운드가 (지난 라운드의 쌍당 시간으로) deadline을 넘길 것 같으면 지금의 1등을 돌려준다
+    returns (best guess, its estimated entropy, answers sampled, guesses left)
+    '''
+    alive = np.asarray(guess_idx)
+    order = rng.permutation(np.asarray(ans_idx))
+    A = len(order)
+    counts = np.zeros((len(alive), NUM_CODES), dtype=np.int32)
+    n, pair_seconds = 0, 0.0
+    while True:
+        stop = min(max(n * growth, first), A)
+        if deadline is not None and n and time.time() + pair_seconds * len(alive) * (stop - n) > deadline:
+            break
+        round_start = time.time()
+        counts += bucket_counts(alive, order[n:stop], words, patterns, ram_cap)
+        pair_seconds = (time.time() - round_start) / max(len(alive) * (stop - n), 1)
+        n = stop
+
+        p = counts / n
+        log_p = np.log2(np.maximum(p, 1e-300))
+        entropy = -(p * log_p).sum(axis=1)
+        if n == A:
+            estimate, width = entropy, np.zeros_like(entropy)
+        else:
+            bias = ((counts > 0).sum(axis=1) - 1) / (2 * n * np.log(2))
+            variance = np.maximum((p * log_p ** 2).sum(axis=1) - entropy ** 2, 0)
+            estimate = entropy + bias
+            width = z * np.sqrt(variance / n * (A - n) / (A - 1)) + bias
+        leader = np.argmax(estimate)
+        keep = estimate + width >= estimate[leader] - width[leader]
+        alive, counts, estimate = alive[keep], counts[keep], estimate[keep]
+        if len(alive) == 1 or n == A:
+            break
+    best = np.argmax(estimate)
+    return alive[best], estimate[best], n, len(alive)
+
+
+def two_ply_entropy(first_idx, guess_idx, ans_idx, words, patterns=None, ram_cap=DEFAULT_RAM_CAP, deadline=None):
+    '''
+    first_idx의 각 g1에 대해 H(g1) + sum_b p_b * max_{g2 in guess_idx} H(b | g2)  (b는 g1의 bucket, 두 번째 guess는 bucket마다 따로 고른다)
+    (g1 bucket, g2 코드)를 bucket * 243 + code2 하나로 합쳐서 (g1, g2 tile)마다 bincount 한 번으로 센다
+    g2 tile 코드는 모든 g1이 같이 쓰므로 비용은 한 수 엔트로피 (guess_idx x ans_idx)의 len(first_idx)배 정도
+    deadline이 지나면 첫 tile 이후 멈추고, 그때까지 본 g2만으로 비교한다 (모든 g1이 같은 g2를 봤으므로 공평하다)
+    returns (scores, number of follow-up guesses evaluated)
+    '''
+    first_idx = np.asarray(first_idx)
+    guess_idx = np.asarray(guess_idx)
+    ans_idx = np.asarray(ans_idx)
+    A = len(ans_idx)
+    if patterns is not None:
+        first_codes = np.asarray(patterns[np.ix_(first_idx, ans_idx)])
+    else:
+        first_codes = feedback_codes(words[first_idx], words[ans_idx])
+
+    table = nlogn_table(A)
+    buckets, sizes, follow = [], [], []
+    for codes in first_codes:
+        _, bucket = np.unique(codes, return_inverse=True)
+        buckets.append(bucket.astype(np.intp) * NUM_CODES)
+        sizes.append(np.bincount(bucket))
+        follow.append(np.zeros(len(sizes[-1])))
+    max_bins = max(len(size) for size in sizes) * NUM_CODES
+
+    # uint8 codes + int64 joint codes per pair, int64 joint histogram per follow-up guess
+    tile_g = max(ram_cap // (A * STREAM_BYTES_PER_PAIR + max_bins * 8), 1)
+    scratch = np.empty(tile_g * A, dtype=np.uint8)
+    evaluated = 0
+    for g0 in range(0, len(guess_idx), tile_g):
+        if deadline is not None and g0 and time.time() > deadline:
+            break
+        g_idx = guess_idx[g0:g0 + tile_g]
+        g = len(g_idx)
+        tile = scratch[:g * A].reshape(g, A)
+        if patterns is not None:
+            tile[...] = patterns[np.ix_(g_idx, ans_idx)]
+        else:
+            feedback_codes(words[g_idx], words[ans_idx], out=tile)
+        for k in range(len(first_idx)):
+            bins = len(sizes[k]) * NUM_CODES
+            offsets = (np.arange(g, dtype=np.intp) * bins)[:, None]
+            counts = np.bincount((tile + buckets[k] + offsets).ravel(), minlength=g * bins).reshape(g, -1, NUM_CODES)
+            # H(b | g2) = log2|b| - sum c log2 c / |b| for every (g2, b) at once
+            entropy = np.log2(sizes[k]) - table[counts].sum(axis=2) / sizes[k]
+            np.maximum(follow[k], entropy.max(axis=0), out=follow[k])
+        evaluated += g
+
+    scores = np.empty(len(first_idx))
+    for k in range(len(first_idx)):
+        first_entropy = np.log2(A) - table[sizes[k]].sum() / A
+        scores[k] = first_entropy + (sizes[k] / A) @ follow[k]
+    return scores, evaluated
@@ -0,0 +1,265 @@
+import time
+
+import numpy as np
+
+from patterns import SOLVED, feedback_codes
+from scoring import NUM_CODES, distinct_guesses, distinct_rows, score_counts, score_guesses
+
+# plausible sets up to EXACT_LIMIT get the exact optimum: every word of the list is a candidate at every node
+EXACT_LIMIT = 100
+# up to BEAM_LIMIT the same search as a beam: a pool of the top 300 guesses plus the plausibles, and the
+# BEAM_BRANCH most promising of them per node. a heuristic, usually within 0.01 guesses of the optimum
+BEAM_LIMIT = 300
+BEAM_BRANCH = 16
+# same for the worst-case search of the minimax strategy
+MINIMAX_LIMIT = 300
+MINIMAX_BRANCH = 16
+STRATEGIES = ("expected", "minimax")
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def _lower_bound(n):
+    # one answer can be solved by the first guess, every other one needs at least two
+    return 2 * n - 1
+
+
+class _PoolSearch:
+    '''
+    ExactSolver / MinimaxSolver 공통: guess 후보 pool과 (pool x S) 코드 행렬을 준비하고, 부분집합마다 bucket을 센다
+    guess 후보는 (guess 수 x |S|) 코드가 pool_pairs 안이면 (None이면 항상) 전체 단어, 아니면 _pool_order 상위 pool_size개 + S
+    그중 S를 똑같이 나누는 guess들은 하나만 남긴다
+    branch가 있으면 각 노드에서 순서상 앞의 branch개 guess만 본다 (None이면 pool 안에서 exact, pool_pairs도 None이면 진짜 최적)
+    cancel (threading.Event)이 set되면 deadline처럼 다음 노드에서 SearchTimeout
+    '''
+
+    def __init__(self, words, patterns=None, pool_pairs=1_000_000, pool_size=300, branch=None, cancel=None):
+        self.words = words
+        self.patterns = patterns
+        self.pool_pairs = pool_pairs
+        self.pool_size = pool_size
+        self.branch = branch
+        self.cancel = cancel
+        self.table = {}
+        self.nodes = 0
+
+    def _pool_order(self, scores):
+        return np.argsort(-scores.entropy, kind="stable")
+
+    def _prepare(self, plausible_idx, deadline):
+        S = np.asarray(plausible_idx)
+        N = len(self.words)
+        if self.pool_pairs is None or N * len(S) <= self.pool_pairs:
+            pool = np.arange(N)
+        else:
+            scores = score_guesses(np.arange(N), S, self.words, self.patterns)
+            pool = np.union1d(self._pool_order(scores)[:self.pool_size], S)
+
+        if self.patterns is not None:
+            codes = np.asarray(self.patterns[np.ix_(pool, S)])
+        else:
+            codes = feedback_codes(self.words[pool], self.words[S])
+        # guesses with the same partition of S are interchangeable everywhere below it
+        keep = distinct_rows(codes) if len(S) > 1 else np.arange(len(pool))
+        self.root = S
+        self.pool = pool[keep]
+        self.codes = codes[keep]
+        self.deadline = deadline
+
+    def _visit(self):
+        self.nodes += 1
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout
+        if self.cancel is not None and self.cancel.is_set():
+            raise SearchTimeout
+
+    def _counts(self, rows, local):
+        codes = self.codes[rows][:, local]
+        offsets = (np.arange(len(rows), dtype=np.intp) * NUM_CODES)[:, None]
+        counts = np.bincount((codes + offsets).ravel(), minlength=len(rows) * NUM_CODES).reshape(-1, NUM_CODES)
+        # guesses that leave everything in one bucket never make progress, and of the guesses that
+        # split local the same way one is enough here and in every subset below
+        useful = distinct_rows(codes)
+        return rows[useful], codes[useful], counts[useful]
+
+    def _groups(self, codes, local):
+        '''
+        guess 하나의 코드 행으로 local을 bucket별로 나눈다 (solved 제외, 큰 bucket부터)
+        '''
+        by_code = np.argsort(codes, kind="stable")
+        sorted_codes = codes[by_code]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        groups = [local[g] for g, c in zip(np.split(by_code, starts[1:]), sorted_codes[starts]) if c != SOLVED]
+        # big buckets first, they decide whether this guess survives the cutoff
+        groups.sort(key=len, reverse=True)
+        return groups
+
+
+class ExactSolver(_PoolSearch):
+    '''
+    plausible 집합 S에 대해 T(S) = (S의 모든 정답을 맞추는 데 드는 guess 수의 합)을 최소화한다
+    T(S) = |S| + sum_{solved가 아닌 bucket b} T(b),  T({a}) = 1,  T(S) >= 2|S| - 1
+    pool_pairs=None, branch=None일 때만 최적이고, 그 밖에는 pool과 branch 안에서 찾는 beam search (heuristic)
+    - transposition table: 정렬된 plausible 인덱스의 bytes -> (T 또는 그 하한, guess 인덱스, 다 풀었는지 (하한이 아닌지)).
+      문제 안에서 턴을 넘어 공유한다. beam이면 T는 beam 안의 값이라 최적 탐색과 table을 섞지 않는다
+    - bound가 작은 guess부터 보고, 지금까지의 최선 + 남은 bucket들의 하한으로 가지치기 (alpha-beta처럼 limit을 넘긴다)
+    '''
+
+    def best(self, plausible_idx, deadline=None):
+        '''
+        returns (guess, expected number of guesses from now), deadline이 지나면 SearchTimeout
+        '''
+        self._prepare(plausible_idx, deadline)
+        total, guess = self._solve(np.arange(len(self.root)), np.inf)
+        return int(guess), total / len(self.root)
+
+    def _solve(self, local, limit, rows=None):
+        '''
+        rows: 부모에서 S를 나눌 수 있었던 guess들 (부분집합을 나눌 수 있는 guess는 그 안에 있다)
+        '''
+        n = len(local)
+        if n <= 2:
+            # guess either one: 1 (+ 2 for the other)
+            return 2 * n - 1, self.root[local[0]]
+
+        key = self.root[local].tobytes()
+        entry = self.table.get(key)
+        if entry is not None:
+            value, guess, solved = entry
+            if solved or value >= limit:
+                return value, guess
+
+        self._visit()
+        if rows is None:
+            rows = np.arange(len(self.pool))
+        rows, codes, counts = self._counts(rows, local)
+        solved = counts[:, SOLVED]
+        lower = 3 * n - 2 * solved - ((counts > 0).sum(axis=1) - solved)
+        # same bound: smaller expected bucket first, so a good incumbent prunes the rest early
+        order = np.lexsort(((counts.astype(np.int64) ** 2).sum(axis=1), lower))
+        if self.branch is not None:
+            order = order[:self.branch]
+
+        best_total, best_row = np.inf, None
+        for i in order:
+            cutoff = min(best_total, limit)
+            if lower[i] >= cutoff:
+                break
+            groups = self._groups(codes[i], local)
+            total = n
+            rest = sum(_lower_bound(len(g)) for g in groups)
+            for group in groups:
+                rest -= _lower_bound(len(group))
+                sub, _ = self._solve(group, cutoff - total - rest, rows)
+                total += sub
+                if total + rest >= cutoff:
+                    break
+            if total < best_total and total + rest < cutoff:
+                best_total, best_row = total, rows[i]
+                if best_total == lower[order[0]]:
+                    break
+
+        if best_row is None:
+            # every guess was cut off: only know T(S) >= limit
+            self.table[key] = (limit, None, False)
+            return limit, None
+        self.table[key] = (best_total, self.pool[best_row], True)
+        return best_total, self.pool[best_row]
+
+
+class MinimaxSolver(_PoolSearch):
+    '''
+    plausible 집합 S에 대해 D(S) = (S의 어떤 정답이든 맞추는 데 드는 guess 수의 최댓값)을 최소화한다
+    D({a}) = 1,  D(S) = 1 + max_{solved가 아닌 bucket b} D(b)
+    - depth를 하한부터 하나씩 올리며 "depth 번 안에 모두 풀 수 있나"만 묻는다 (iterative deepening)
+    - 큰 bucket부터 풀어 보고 하나라도 안 되면 그 guess는 바로 버린다 (alpha-beta의 cutoff)
+    - transposition table: 정렬된 plausible 인덱스의 bytes -> (D의 하한, D의 상한, 상한을 만드는 guess)
+    '''
+
+    def _pool_order(self, scores):
+        return np.lexsort((-scores.entropy, scores.max_bucket))
+
+    def best(self, plausible_idx, deadline=None):
+        '''
+        returns (guess, guaranteed number of guesses from now), deadline이 지나면 SearchTimeout
+        '''
+        self._prepare(plausible_idx, deadline)
+        local = np.arange(len(self.root))
+        depth = 1
+        while True:
+            guess = self._solve(local, depth)
+            if guess is not None:
+                return int(guess), depth
+            depth += 1
+
+    def _solve(self, local, depth, rows=None):
+        '''
+        depth 번 안에 local을 모두 풀 수 있으면 그 첫 guess, 아니면 None
+        '''
+        n = len(local)
+        if n == 1:
+            return self.root[local[0]]
+        if depth < 2:
+            return None
+        if n == 2:
+            return self.root[local[0]]
+
+        key = self.root[local].tobytes()
+        lower, upper, guess = self.table.get(key, (2, np.inf, None))
+        if depth >= upper:
+            return guess
+        if depth < lower:
+            return None
+
+        self._visit()
+        if rows is None:
+            rows = np.arange(len(self.pool))
+        rows, codes, counts = self._counts(rows, local)
+        solved = counts[:, SOLVED]
+        largest = np.where(np.arange(NUM_CODES) == SOLVED, 0, counts).max(axis=1)
+        # smallest worst bucket first, then guesses that may win outright, then the smaller expected bucket
+        order = np.lexsort(((counts.astype(np.int64) ** 2).sum(axis=1), -solved, largest))
+        if depth == 2:
+            # the last guess has to hit: every bucket must already be a single answer
+            order = order[largest[order] <= 1]
+        if self.branch is not None:
+            order = order[:self.branch]
+
+        for i in order:
+            groups = self._groups(codes[i], local)
+            if all(self._solve(group, depth - 1, rows) is not None for group in groups):
+                self.table[key] = (lower, depth, self.pool[rows[i]])
+                return self.pool[rows[i]]
+        self.table[key] = (depth + 1, upper, guess)
+        return None
+
+
+def minimax_guess(words, plausible_idx, histograms, minimax, deadline=None, batch=1024):
+    '''
+    minimax 전략의 guess. MINIMAX_LIMIT 이하는 MinimaxSolver로 정확히,
+    그보다 크면 가장 큰 bucket이 가장 작은 guess (엔트로피, plausible 여부 순으로 tie-break)
+    deadline이 지나면 첫 batch 이후 지금까지 본 guess 중에서 고른다
+    pattern matrix가 있으면 plausible을 똑같이 나누는 guess들은 하나만 본다
+    returns (guess, whether every guess was looked at)
+    '''
+    if len(plausible_idx) <= MINIMAX_LIMIT:
+        return minimax.best(plausible_idx, deadline)[0], True
+    histograms.restrict(plausible_idx)
+    plausible = np.zeros(len(words), dtype=bool)
+    plausible[plausible_idx] = True
+    guess_idx = distinct_guesses(np.arange(len(words)), plausible_idx, words, minimax.patterns)
+    # possible answers first, they are the likeliest to be picked anyway
+    order = guess_idx[np.argsort(~plausible[guess_idx], kind="stable")]
+
+    max_bucket, entropy = [], []
+    for start in range(0, len(order), batch):
+        if deadline is not None and start and time.time() > deadline:
+            break
+        scores = score_counts(histograms.rows(order[start:start + batch]))
+        max_bucket.append(scores.max_bucket)
+        entropy.append(scores.entropy)
+    max_bucket, entropy = np.concatenate(max_bucket), np.concatenate(entropy)
+    seen = order[:len(max_bucket)]
+    return int(seen[np.lexsort((~plausible[seen], -entropy, max_bucket))[0]]), len(seen) == len(order)
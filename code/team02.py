@@ -2,7 +2,9 @@ import atexit
 import datetime
 import json
 import os
+import threading
 import time
+import zlib
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
 from dotenv import load_dotenv
@@ -12,6 +14,16 @@ from snowflake.cortex import complete
 import numpy as np
 from scipy.stats import mode
 
+from book import BookBuilder, load_book, save_book
+from constraints import ConstraintIndex, PostingLists
+from memo import StateMemo, state_key
+from patterns import SOLVED, decode_words, feedback_codes, feedback_to_code, fingerprint, is_feedback, load_pattern_matrix, sorted_words
+from planner import GUESS_STRATEGIES, load_cost_model
+from rules import KERNEL_RULE, get_rule
+from scoring import NUM_CODES, BucketHistograms, best_guess, distinct_guesses, letter_frequency_scores, sampled_guess, score_counts, score_guesses, two_ply_entropy, two_stage_guess
+from search import BEAM_BRANCH, BEAM_LIMIT, EXACT_LIMIT, MINIMAX_BRANCH, STRATEGIES, ExactSolver, MinimaxSolver, SearchTimeout, minimax_guess
+from tree import load_tree
+
 load_dotenv()
 
 class Solver:
@@ -20,6 +32,54 @@ class Solver:
         self.model = "claude-3-5-sonnet"
         self.problems = {}
         self.snowflake_calls = 0
+        self.pattern_build_limit = 6000
+        # rules without a kernel-equivalent build with their own batch, ~10x slower (1.2s for 2000 words)
+        self.rule_build_limit = 1500
+        # exact entropy streams through tiles under this cap, so only time (not memory) limits it
+        self.ram_cap = int(os.environ.get("SOLVER_RAM_CAP_MB", 256)) * 2**20
+        # grader limits, measured from start_problem
+        self.first_guess_limit = 10
+        self.problem_limit = 60
+        # kept free for HTTP/logging, and reserved per future turn for the LLM translation
+        self.safety_margin = 1.0
+        self.feedback_seconds = 6.0
+        # optimal expected guesses over every word up to exact_limit plausibles, a beam search up to beam_limit
+        self.exact_limit = EXACT_LIMIT
+        self.beam_limit = BEAM_LIMIT
+        self.beam_branch = BEAM_BRANCH
+        # lists this large rank guesses by letter frequencies first and score only the top k exactly,
+        # with k the largest the cost model fits into the two_stage share of the turn
+        self.two_stage_words = 10_000
+        self.two_stage_min_k = 128
+        # sampled entropy draws from a per-problem generator seeded with (seed, problem id),
+        # so a problem replays the same guesses however many run at once
+        self.seed = int(os.environ.get("SOLVER_SEED", 0))
+        # per-strategy runtime predictions, calibrated once per host with planner.py
+        self.cost_model = load_cost_model()
+        # (word list, rule, strategy, plausible set) -> guess, shared by every problem and kept across runs;
+        # every new entry is appended to the memo file, which is compacted at startup and exit
+        self.memo = StateMemo(max_entries=int(os.environ.get("SOLVER_MEMO_ENTRIES", 100_000)))
+        # after a guess, the grader and the LLM translation leave the CPU idle for seconds: plan the follow-up of
+        # every feedback bucket into the state memo meanwhile, within speculate_seconds and speculate_ram_cap,
+        # one problem at a time, and cancelled as soon as any turn or problem starts
+        self.speculate = os.environ.get("SOLVER_SPECULATE", "1") == "1"
+        self.speculate_seconds = self.feedback_seconds
+        self.speculate_ram_cap = self.ram_cap // 4
+        self.speculation_lock = threading.Lock()
+        self.speculation_runs = []
+        # opening book of a fresh list, built in the same idle time after the speculated buckets and paused with them;
+        # one at a time, the next fresh list waits for this one to be saved
+        self.book_builder = None
+        # SOLVER_BENCHMARK=1 also scores every guess to log how well the prefilter kept the exact leaders
+        self.benchmark = os.environ.get("SOLVER_BENCHMARK") == "1"
+        # rescore this many one-step entropy leaders with a two-ply lookahead (0 = off);
+        # costs about lookahead_k times the full-entropy search
+        self.lookahead_k = int(os.environ.get("SOLVER_LOOKAHEAD_K", 0))
+        # feedback rule a problem is played under unless start_problem names one (see rules.py)
+        self.feedback_rule = get_rule(os.environ.get("SOLVER_FEEDBACK_RULE", KERNEL_RULE)).name
+        # "expected" minimises the average number of guesses, "minimax" the worst game
+        self.strategy = os.environ.get("SOLVER_STRATEGY", "expected")
+        assert self.strategy in STRATEGIES, f"unknown strategy {self.strategy}"
         self.log_file = open("run.log", "a")
         atexit.register(self.cleanup)
 
@@ -36,6 +96,10 @@ class Solver:
         return Session.builder.configs(connection_params).create()
 
     def cleanup(self):
+        try:
+            self.memo.compact()
+        except:
+            pass
         try:
             self.log_file.close()
         except:
@@ -45,23 +109,65 @@ class Solver:
         except:
             pass
 
-    def start_problem(self, problem_id, candidate_words):
-        candidate_words = np.array(candidate_words, dtype='<U5')
+    def start_problem(self, problem_id, candidate_words, feedback_rule=None):
+        # the grader's clock starts with this request, so loading or building the matrix counts against turn 1
+        start_time = time.time()
+        # a game that ended on a lucky guess leaves its speculation running into this one
+        self._cancel_speculation()
+        # (N, 5) uint8 letter codes, sorted so indices line up with the cached pattern matrix
+        words = sorted_words(candidate_words)
+        rule = get_rule(feedback_rule or self.feedback_rule)
+        if rule.same_as is not None:
+            # same codes on every pair: share the kernel's matrix, memo, book and tree
+            rule = get_rule(rule.same_as)
+        if rule.name != KERNEL_RULE and len(words) > self.rule_build_limit:
+            # every cache and the on-the-fly kernel follow KERNEL_RULE; other rules need their own matrix
+            self._log(f"{rule.name} rule needs an in-memory pattern matrix, too many words: using {KERNEL_RULE}")
+            rule = get_rule(KERNEL_RULE)
+        if rule.name == KERNEL_RULE:
+            # building costs O(N^2) so only do it inline for small lists; large ones need the precompute step
+            patterns = load_pattern_matrix(words, build=len(words) <= self.pattern_build_limit)
+        else:
+            patterns = rule.batch(words, words)
+        cached = rule.name == KERNEL_RULE
         self.problems[problem_id] = {
-            "candidate_words": candidate_words,
-            "plausible_words": candidate_words.copy(),
+            "start_time": start_time,
+            "words": words,
+            "plausible_idx": np.arange(len(words)),
+            "rule": rule.name,
+            "fingerprint": fingerprint(words),
+            "rng": np.random.default_rng([self.seed, zlib.crc32(str(problem_id).encode())]),
+            "constraints": ConstraintIndex(words),
+            "patterns": patterns,
+            # (guess, code) -> answers, rows built the first time a guess gets feedback
+            "postings": PostingLists(patterns) if patterns is not None else None,
+            "histograms": BucketHistograms(words, patterns, self.ram_cap),
+            "exact": ExactSolver(words, patterns, pool_pairs=None),
+            "beam": ExactSolver(words, patterns, branch=self.beam_branch),
+            "minimax": MinimaxSolver(words, patterns, branch=MINIMAX_BRANCH),
+            # the book follows the expected-guess rule, so the minimax strategy goes without it
+            "book": load_book(words) if cached and self.strategy == "expected" else None,
+            # compiled offline with tree.py; walked from the root while the feedback stays on it
+            "tree": load_tree(words, strategy=self.strategy) if cached else None,
+            "tree_node": 0,
             "feedback_history": [],
             "translated_feedback": [],
+            # indices into words, decoded only when sent back
             "guess_history":[]
         }
+        # this run computes turns 1-2 itself, the next run with the same list just looks them up; without a
+        # pattern matrix a book costs minutes of kernel time, so those lists need the offline book.py
+        self.problems[problem_id]["build_book"] = (cached and patterns is not None and self.strategy == "expected"
+                                                  and self.problems[problem_id]["book"] is None)
         self._log(f"\n=== Starting Problem {problem_id} ===")
-        self._log(f"Candidate words: {', '.join(candidate_words[:5])}")
+        self._log(f"Candidate words: {', '.join(decode_words(words[:5]))}")
 
     def add_feedback(self, problem_id, verbal_feedback):
         if verbal_feedback:
-            last_guess = self.problems[problem_id]["guess_history"][-1]
-            self.problems[problem_id]["feedback_history"].append(verbal_feedback)
-            self.problems[problem_id]["translated_feedback"].append(self.translate(verbal_feedback, last_guess))
+            problem = self.problems[problem_id]
+            last_guess = decode_words(problem["words"][problem["guess_history"][-1:]])[0]
+            problem["feedback_history"].append(verbal_feedback)
+            problem["translated_feedback"].append(self.translate(verbal_feedback, last_guess))
 
     def translate(self, verbal_feedback, guess):
         # new try, not used. if the verbal feedback can be separated by a specific sign, then divide the verbal feedback            
@@ -194,231 +300,358 @@ class Solver:
 
         start_time = time.time()
 
-        candidates = self.problems[problem_id]["candidate_words"]
-        plausibles = self.problems[problem_id]["plausible_words"]
-        history = self.problems[problem_id]["feedback_history"]
-        translated_history = self.problems[problem_id]["translated_feedback"]
-        guess_history = self.problems[problem_id]["guess_history"]
-
-        def query_res(word, ans):            
-            feedback = np.zeros(5)
-            for i in range(5):
-                if word[i] == ans[i]:
-                    feedback[i] = 2
-
-            remaining = {}
-            for i, ch in enumerate(ans):
-                if feedback[i] != 2:
-                    remaining[ch] = remaining.get(ch, 0) + 1
-
-            for i in range(5):
-                if feedback[i] != 2 and remaining.get(word[i], 0) > 0:
-                    feedback[i] = 1
-                    remaining[word[i]] -= 1
-
-            return feedback
-        
-        if history:
-            last_guess = guess_history[-1]
-            last_guess_res = translated_history[-1]
-            mask = [(tuple(query_res(word=last_guess, ans=t)) == tuple(last_guess_res)) for t in plausibles]
-            mask = np.array(mask, dtype=bool)
-            plausibles = plausibles[mask]
-            self.problems[problem_id]["plausible_words"] = plausibles
-
-
-        def query_res_all(ans: str, words: list[str]) -> np.ndarray:
-            ans = np.array(list(ans), dtype='<U1')
-            words = np.array([list(word) for word in words], dtype='<U1')
-            N: int = words.shape[0]
-
-            not_greens = (ans != words) # (N, 5)
-
-            matches = (words[:, :, None] == ans[None, None, :]) # (N, 5, 5)
-            '''
-            matches[x][i][j]
-            x번째 단어의 i번째 문자와 답의 j번째 문자가 같은지 여부
-            '''
-            t = (matches & not_greens[:, None, :]).sum(axis=2) # (N, 5)
-            '''
-            def get_t(word: str, ans: str, i: int) -> int:
-                cnt: int = 0
-                for j in range(5):
-                    if ans[j] == word[i] and ans[j] != word[j]:
-                        cnt += 1
-                return cnt
-            '''
-
-            matches = (words[:, :, None] == words[:, None, :]) # (N, 5, 5)
-            '''
-            matches[x][i][j]
-            x번째 단어의 i번째 문자와 x번째 단어의 j번째 문자가 같은지 여부
-            '''
-            s = np.cumsum(matches & not_greens[:, None, :], axis=2)[np.arange(N)[:, None], np.arange(5), np.arange(5)] # (N, 5)
-            '''
-            def get_s(word: str, ans: str, i: int) -> int:
-                cnt: int = 0
-                for j in range(i+1):
-                    if word[j] == word[i] and ans[j] != word[j]:
-                        cnt += 1
-                return cnt
-            '''
-            
-            res = np.full_like(words, fill_value=2, dtype=int) # (N, 5)
-            res[not_greens] = (t >= s)[not_greens].astype(int)
+        problem = self.problems[problem_id]
+        words = problem["words"]
+        plausible_idx = problem["plausible_idx"]
+        patterns = problem["patterns"]
+        history = problem["feedback_history"]
+        translated_history = problem["translated_feedback"]
+        guess_history = problem["guess_history"]
+        self._cancel_speculation()
 
-            res = (res * np.array([1, 3, 9, 27, 81])).sum(axis=1) # (N,)
+        if history:
+            plausible_idx = self._consistent(problem, guess_history[-1], translated_history[-1], plausible_idx)
+            problem["plausible_idx"] = plausible_idx
 
-            return res
+        turn_budget = self._turn_budget(problem, turn, len(plausible_idx))
+        deadline = start_time + turn_budget
 
         guess = None
 
         # for fallback
-        if 'probs' not in self.problems[problem_id].keys():
-            self.problems[problem_id]["probs"] = 1/len(candidates) * np.ones(len(candidates))
-        probs = self.problems[problem_id]["probs"]
+        if 'probs' not in problem.keys():
+            problem["probs"] = 1/len(words) * np.ones(len(words))
+        probs = problem["probs"]
         belief = 100
         if history:
-            last_guess, last_guess_res = guess_history[-1], translated_history[-1]
-            for i, word in enumerate(candidates):
-                res = query_res(last_guess, word)
-                if np.array_equal(res, last_guess_res):
-                    probs[i] *= belief
-                if word == last_guess:
-                    probs[i] *= 0    
+            last_guess = guess_history[-1]
+            probs[self._consistent(problem, last_guess, translated_history[-1])] *= belief
+            probs[last_guess] *= 0
             probs /= probs.sum()
-            self.problems[problem_id]["prob"] = probs
-
+            problem["prob"] = probs
+
+        # a translation with a digit outside 0-2 has no code: off the tree and the book, and no plausible answer left
+        valid = not history or is_feedback(translated_history[-1])
+        tree = problem["tree"]
+        if tree is not None and history and problem["tree_node"] is not None:
+            problem["tree_node"] = tree.child(problem["tree_node"], feedback_to_code(translated_history[-1])) if valid else None
+
+        book = problem["book"]
+        book_guess = None
+        if book is not None and len(plausible_idx) > 0:
+            if not guess_history:
+                book_guess = book["first"]
+            elif guess_history == [book["first"]] and valid:
+                book_guess = book["second"].get(feedback_to_code(translated_history[-1]))
+
+        # the tree already holds every follow-up, and after the book's first guess so does the book
+        speculate = self.speculate and not (tree is not None and problem["tree_node"] is not None) and not (book_guess is not None and not guess_history)
+
+        # decision tree
+        if tree is not None and problem["tree_node"] is not None:
+            guess = tree.guess[problem["tree_node"]]
+        # opening book
+        elif book_guess is not None:
+            guess = book_guess
         # when find
-        if len(plausibles)==1:
-            guess = plausibles[0]
+        elif len(plausible_idx)==1:
+            guess = plausible_idx[0]
         # when fallback
-        elif len(plausibles)==0:
+        elif len(plausible_idx)==0:
             print('FALLBACK ACTIVATED')
-            k = 1_000_000 // len(candidates)
-            sampled_plausibles = candidates[np.random.choice(len(candidates), size=k, p=probs)]
-            sampled_candidates = np.unique(sampled_plausibles.copy())
-            res = np.zeros((len(sampled_candidates), len(sampled_plausibles)), dtype=int)
-            
-            for i, ans in enumerate(sampled_candidates):
-                res[i] = query_res_all(ans, sampled_plausibles)
-            
-            counts = np.zeros((len(sampled_candidates), 273), dtype=int)
-            for i in range(len(sampled_candidates)):
-                counts[i] = np.bincount(res[i], minlength=273)
-            
-            probs2 = counts / counts.sum(axis=1, keepdims=True)
-            probs_ = probs2.copy()
-            probs_[probs2 == 0] = 1
-            entropies = -np.sum(probs2 * np.log2(probs_), axis=1)
+            k = 1_000_000 // len(words)
+            sampled_idx = problem["rng"].choice(len(words), size=k, p=probs)
+            sampled_candidates = np.unique(sampled_idx)
+            entropies = score_guesses(sampled_candidates, sampled_idx, words, patterns, self.ram_cap).entropy
             guess = sampled_candidates[np.argmax(entropies)]
 
-        elif len(plausibles) * len(candidates) > 1_000_000:
-            print('SAMPLED ENTROPY ACTIVATED')
-            sample_size = min(1_000_000 // len(plausibles), len(plausibles))
-            sampled_candidates = np.random.choice(plausibles, sample_size, replace=False)
-            res = np.zeros((len(plausibles), sample_size), dtype=int)
-            
-            for i, ans in enumerate(plausibles):
-                res[i] = query_res_all(ans, sampled_candidates)
-            
-            counts = np.zeros((len(plausibles), 273), dtype=int)
-            for i in range(len(plausibles)):
-                counts[i] = np.bincount(res[i], minlength=273)
-            
-            probs = counts / counts.sum(axis=1, keepdims=True)
-            probs_ = probs.copy()
-            probs_[probs == 0] = 1
-            entropies = -np.sum(probs * np.log2(probs_), axis=1)
-            
-            guess = plausibles[np.argmax(entropies)]
-        
-        elif len(plausibles) < 10:
-            # todo: brute-force code
-            candidates_str = np.array(candidates)
-            plausibles_str = np.array(plausibles)
-
-            remaining_candidates = np.setdiff1d(candidates_str, plausibles_str)
-
-            num_needed = min(len(remaining_candidates), 100 - len(plausibles_str))
-            extra_selected = np.random.choice(remaining_candidates, num_needed, replace=False)
-
-            small_candidates = list(plausibles_str) + list(extra_selected)
-
-            n = len(plausibles)
-            m = len(small_candidates)
-
-            dp = np.ones((1 << n, m, n), dtype=int) * 1000
-            _min = np.ones((1 << n, n)) * 1000
-
-            def solve(bit, k):
-                if (bit & (1<<k)) == 0:
-                    return
-                if _min[bit][k] < 1000:
-                    return
-                if bit == (1 << k):
-                    dp[bit, :, k] = 1
-                    _min[bit][k] = 1
-                    return
-                # print(bit, k)
-                for i in range(m):
-                    _bit = bit
-                    for j in range(n):
-                        if bit & (1<<j):
-                            if np.array_equal(
-                                query_res(small_candidates[i], plausibles[k]), 
-                                query_res(small_candidates[j], plausibles[k])
-                            ):
-                                continue
-                            _bit -= (1<<j)
-                    
-                    assert(bit != _bit)
-
-                    solve(_bit, k)
-                    dp[bit][i][k] = _min[_bit][k]
-                
-                    _min[bit][k] = min(_min[bit][k], dp[bit][i][k])
-            
-            for bit in range(1<<n):
-                for k in range(n):
-                    solve(bit, k)
-
-            temp = dp.sum(axis=2)[(1<<n)-1]
-            guess = 0
-            for i in range(1, m):
-                if temp[guess] >= temp[i]:
-                    guess = i
-            guess = small_candidates[guess]
-
-        else: 
-            res = np.zeros((len(plausibles), len(candidates)), dtype=int)
-            for i, ans in enumerate(plausibles):
-                res[i] = query_res_all(ans, candidates)
-
-            res = res.T
-
-            counts = np.zeros((len(candidates), 273), dtype=int)
-            
-            for i in range(len(candidates)):
-                counts[i] = np.bincount(res[i], minlength=273)
-            
-            probs = counts/counts.sum()
-            probs_ = probs.copy()
-            probs_[probs == 0] = 1
-            entropies = -np.sum(probs * np.log2(probs_), axis=1)
-            mask = np.array([(i in plausibles) for i in entropies])
-            entropies[mask] += (1/len(plausibles))
-            guess = candidates[np.argmax(entropies)]
+        # best strategy the cost model says fits the rest of the turn; one that times out hands over to the next one down
+        # a state some earlier game already solved at least as well is answered from the memo
+        else:
+            guess = self._planned_guess(problem, problem, plausible_idx, deadline, self.ram_cap)
         
-        self.problems[problem_id]["guess_history"].append(guess)
+        problem["guess_history"].append(int(guess))
+        if problem.pop("build_book", False) and self.book_builder is None:
+            # not before the first guess, which has the tightest limit
+            self.book_builder = BookBuilder(words, patterns, self.ram_cap)
+        self._start_speculation(problem, int(guess), plausible_idx, speculate and len(plausible_idx) > 1)
+        guess = decode_words(words[[guess]])[0]
 
         self._log(f"Turn {turn}: Received feedback: {history[-1] if history else 'None'}")
         self._log(f"Translated: {translated_history[-1] if history else 'None'}")
         self._log(f"Turn {turn}: Guess: {guess}")
         self._log(f"time spent for guess: {time.time()-start_time}")
-        self._log(f"plausibles: {len(plausibles)}")
+        self._log(f"plausibles: {len(plausible_idx)}")
         return guess
     
+    def _planned_guess(self, problem, context, plausible_idx, deadline, ram_cap, cancel=None):
+        '''
+        cost model이 deadline 안에 든다고 하는 가장 좋은 전략의 guess. timeout이 나면 그다음 전략으로 넘어간다
+        이미 다른 게임 (또는 speculation)이 같은 상태를 그 이상의 품질로 풀어 뒀으면 memo에서 꺼낸다
+        context: "histograms", "exact", "beam", "minimax", "rng"를 가진 dict. 턴에서는 problem 자신, speculation은 따로 만든 것
+        cancel이 set되면 None을 돌려준다
+        '''
+        words = problem["words"]
+        patterns = problem["patterns"]
+
+        def plausible_bonus():
+            # small bonus for guesses that could also be the answer
+            bonus = np.zeros(len(words))
+            bonus[plausible_idx] = 1/len(plausible_idx)
+            return bonus
+
+        def entropy_guess():
+            histograms = context["histograms"]
+            histograms.restrict(plausible_idx)
+            bonus = plausible_bonus()
+            # no distinct_guesses pass here: branch-and-bound reads fewer rows than the hashing would
+            guess, score, evaluated, complete = best_guess(np.arange(len(words)), plausible_idx, words, histograms.rows, bonus,
+                                                           deadline=deadline, cancel=cancel)
+            self._log(f"scored {evaluated}/{len(words)} guesses, budget {deadline - time.time():.2f}s")
+            return guess, score, complete
+
+        def two_stage():
+            histograms = context["histograms"]
+            histograms.restrict(plausible_idx)
+            bonus = plausible_bonus()
+            budget = (deadline - time.time()) * GUESS_STRATEGIES["two_stage"].share
+            k = max(self.cost_model.largest_k("two_stage", len(words), len(plausible_idx), budget, patterns is not None),
+                    min(self.two_stage_min_k, len(words)))
+            # the cost model only sizes k; on a slower host than the fits the deadline keeps the turn in its slice
+            guess, score, top = two_stage_guess(np.arange(len(words)), plausible_idx, words, histograms.rows, bonus, k,
+                                                deadline=time.time() + budget, cancel=cancel)
+            predicted = self.cost_model.predict("two_stage", len(words), len(plausible_idx), patterns is not None, k)
+            self._log(f"two-stage: exact entropy on top {len(top)}/{len(words)} by letter frequency, "
+                      f"predicted {predicted:.2f}s of {budget:.2f}s")
+            if self.benchmark:
+                self._log_recall(histograms, bonus, top, guess)
+            return guess, score, len(top) == len(words)
+
+        def lookahead_guess():
+            histograms = context["histograms"]
+            histograms.restrict(plausible_idx)
+            bonus = plausible_bonus()
+            # one representative per partition of the plausibles, and none that can't split them
+            guess_idx = distinct_guesses(np.arange(len(words)), plausible_idx, words, patterns, ram_cap)
+            one_step = score_counts(histograms.rows(guess_idx)).entropy + bonus[guess_idx]
+            order = guess_idx[np.argsort(-one_step, kind="stable")]
+            top = order[:self.lookahead_k]
+            # best follow-ups are the likeliest one-step leaders too, so they go first in case the deadline hits
+            scores, evaluated = two_ply_entropy(top, order, plausible_idx, words, patterns, ram_cap, deadline)
+            scores += bonus[top]
+            self._log(f"two-ply over top {len(top)}: {evaluated}/{len(order)} distinct follow-ups, budget {deadline - time.time():.2f}s")
+            return top[np.argmax(scores)], scores.max(), evaluated == len(order)
+
+        def exact_guess(name="exact"):
+            # half the slice, so the next strategy down can still answer if the search runs out
+            guess, expected = context[name].best(plausible_idx, deadline=time.time() + (deadline - time.time()) / 2)
+            self._log(f"{name} search: {expected:.4f} expected guesses, {len(context[name].table)} states")
+            # a search cut short raises SearchTimeout instead
+            return guess, expected, True
+
+        def minimax_search_guess():
+            # smallest worst case; exact below MINIMAX_LIMIT, smallest largest bucket above it
+            guess, complete = minimax_guess(words, plausible_idx, context["histograms"], context["minimax"],
+                                            deadline=time.time() + (deadline - time.time()) / 2)
+            self._log(f"minimax search: {len(context['minimax'].table)} states")
+            return guess, None, complete
+
+        def sampled_entropy_guess():
+            guess, entropy, sampled, left = sampled_guess(plausible_idx, plausible_idx, words, context["rng"], patterns,
+                                                          ram_cap, deadline=deadline)
+            self._log(f"sampled entropy: {entropy:.4f} bits on {sampled}/{len(plausible_idx)} answers, {left} guesses left")
+            return guess, entropy, left == 1 or sampled == len(plausible_idx)
+
+        def heuristic_guess():
+            scores = letter_frequency_scores(np.arange(len(words)), plausible_idx, words) + plausible_bonus()
+            return int(np.argmax(scores)), scores.max(), True
+
+        # name -> () -> (guess, the strategy's own score: bits, expected guesses, or None, whether the search finished)
+        run = {
+            "exact": exact_guess,
+            "beam": lambda: exact_guess("beam"),
+            "minimax": minimax_search_guess,
+            "lookahead": lookahead_guess,
+            "entropy": entropy_guess,
+            "two_stage": two_stage,
+            "sampled": sampled_entropy_guess,
+            "heuristic": heuristic_guess,
+        }
+
+        names = self._strategy_names(len(words), len(plausible_idx))
+        key = state_key(problem["fingerprint"], problem["rule"], self.strategy, plausible_idx)
+        guess = None
+        while guess is None:
+            if cancel is not None and cancel.is_set():
+                return None
+            remaining = deadline - time.time()
+            name, predicted = self.cost_model.plan(names, len(words), len(plausible_idx), remaining,
+                                                   patterns is not None,
+                                                   {"lookahead": self.lookahead_k, "two_stage": self.two_stage_min_k})
+            quality = GUESS_STRATEGIES[name].quality
+            memo = self.memo.get(key)
+            if memo is not None and memo[2] >= quality:
+                guess = memo[0]
+                self._log(f"state memo: {len(plausible_idx)} plausibles, quality {memo[2]}")
+                break
+            self._log(f"planner: {name}, predicted {predicted:.3f}s of {remaining:.2f}s")
+            try:
+                guess, score, complete = run[name]()
+                if cancel is not None and cancel.is_set():
+                    # stopped early, not worth remembering
+                    return None
+                # a best-so-far answer is only as good as this turn's budget, so a later run with more time recomputes it
+                if complete:
+                    self.memo.put(key, guess, score, quality)
+                else:
+                    self._log(f"{name} cut short, not memoized")
+            except SearchTimeout:
+                self._log(f"{name} search timed out")
+                names = [other for other in names if GUESS_STRATEGIES[other].quality < GUESS_STRATEGIES[name].quality]
+        return guess
+
+    def _start_speculation(self, problem, guess, plausible_idx, speculate=True):
+        '''
+        방금 낸 guess의 피드백 bucket마다 (큰 bucket부터) 다음 턴의 guess를 백그라운드에서 _planned_guess로 구해 state memo에 넣는다
+        다음 턴은 자기 상태를 memo에서 찾으므로 따로 결과를 넘겨받을 필요가 없다
+        bucket마다 크기에 비례한 시간 조각을 쓰고, 조각 안에 끝나지 않거나 취소된 결과는 memo에 넣지 않는다
+        speculation 전용 histogram / 탐색기를 써서 턴의 것과 섞이지 않는다
+        그다음 (speculate가 False면 바로) 만들고 있는 opening book을 이어서 만든다. 둘 다 다음 턴이 시작하면 멈춘다
+        '''
+        words, patterns = problem["words"], problem["patterns"]
+        buckets = []
+        # the histograms of one bucket have to fit the budget
+        if speculate and len(words) * NUM_CODES * 4 <= self.speculate_ram_cap:
+            if patterns is not None:
+                codes = np.asarray(patterns[guess][plausible_idx])
+            else:
+                codes = feedback_codes(words[[guess]], words[plausible_idx])[0]
+            values, sizes = np.unique(codes, return_counts=True)
+            # one answer left is a lookup anyway, and solved needs nothing
+            buckets = [plausible_idx[codes == value] for value, size in sorted(zip(values, sizes), key=lambda vs: -vs[1])
+                       if size > 1 and value != SOLVED]
+        if not buckets and self.book_builder is None:
+            return
+
+        cancel = threading.Event()
+        if buckets and "speculation" not in problem:
+            problem["speculation"] = {
+                "exact": ExactSolver(words, patterns, pool_pairs=None),
+                "beam": ExactSolver(words, patterns, branch=self.beam_branch),
+                "minimax": MinimaxSolver(words, patterns, branch=MINIMAX_BRANCH),
+                "rng": problem["rng"].spawn(1)[0],
+            }
+        context = problem.get("speculation")
+
+        def speculate_buckets():
+            # only now: a cancelled run that is still winding down holds the lock and these searches until then
+            context["exact"].cancel = context["beam"].cancel = context["minimax"].cancel = cancel
+            start_time = time.time()
+            stop = start_time + self.speculate_seconds
+            done = 0
+            left = sum(len(bucket) for bucket in buckets)
+            for bucket in buckets:
+                if cancel.is_set() or time.time() > stop:
+                    break
+                # each bucket gets the share of what is left that its answers are of the ones left
+                # (the odds it is the one the next turn meets), so a slow bucket can't starve the rest
+                bucket_stop = time.time() + (stop - time.time()) * len(bucket) / left
+                left -= len(bucket)
+                # a fresh histogram per bucket: sibling buckets are not subsets of each other
+                context["histograms"] = BucketHistograms(words, patterns, self.speculate_ram_cap)
+                if self._planned_guess(problem, context, bucket, bucket_stop, self.speculate_ram_cap, cancel) is None:
+                    break
+                done += 1
+            self._log(f"speculation: {done}/{len(buckets)} buckets in {time.time() - start_time:.2f}s"
+                      f"{', cancelled' if cancel.is_set() else ''}")
+
+        def run():
+            if not self.speculation_lock.acquire(blocking=False):
+                return
+            try:
+                if buckets:
+                    speculate_buckets()
+                builder = self.book_builder
+                if builder is not None and not cancel.is_set():
+                    start_time = time.time()
+                    try:
+                        save_book(builder.words, builder.run(cancel))
+                        self.book_builder = None
+                        self._log(f"opening book: saved, last part in {time.time() - start_time:.2f}s")
+                    except SearchTimeout:
+                        self._log(f"opening book: {len(builder.book['second'])} second guesses so far, paused")
+            finally:
+                self.speculation_lock.release()
+
+        thread = threading.Thread(target=run, daemon=True)
+        self.speculation_runs.append((thread, cancel))
+        thread.start()
+
+    def _cancel_speculation(self, wait=0.2):
+        '''
+        모든 문제의 speculation과 opening book 만들기를 멈춘다 (어느 문제의 턴이든 CPU를 다 쓸 수 있게)
+        탐색은 다음 노드에서, 엔트로피는 다음 batch에서 멈추지만 batch 하나는 끝까지 돌 수 있어서 wait초까지만 기다린다
+        '''
+        runs, self.speculation_runs = self.speculation_runs, []
+        for thread, cancel in runs:
+            cancel.set()
+        for thread, cancel in runs:
+            thread.join(wait)
+
+    def _strategy_names(self, num_words, num_plausibles):
+        '''
+        planner가 이번 턴에 고를 수 있는 전략들 (순서는 상관없고, 품질은 GUESS_STRATEGIES가 정한다)
+        큰 목록의 엔트로피는 two_stage로 구한다
+        '''
+        entropy = "two_stage" if num_words >= self.two_stage_words else "entropy"
+        if self.strategy == "minimax":
+            return ["minimax", entropy, "sampled", "heuristic"]
+        names = [entropy, "sampled", "heuristic"]
+        if self.lookahead_k:
+            names.append("lookahead")
+        if num_plausibles <= self.beam_limit:
+            names.append("beam")
+        if num_plausibles <= self.exact_limit:
+            names.append("exact")
+        return names
+
+    def _log_recall(self, histograms, bonus, top, guess, n=10):
+        '''
+        benchmark mode: 전체 guess의 정확한 순위와 비교해서 prefilter가 놓친 것을 남긴다
+        '''
+        exact = score_counts(histograms.rows(np.arange(len(bonus)))).entropy + bonus
+        leaders = np.argsort(-exact, kind="stable")[:n]
+        recall = np.isin(leaders, top).mean()
+        self._log(f"two-stage recall@{n}: {recall:.2f}, exact best kept: {leaders[0] in top}, "
+                  f"regret {exact[leaders[0]] - exact[guess]:.4f} bits")
+
+    def _consistent(self, problem, guess, feedback, idx=None):
+        '''
+        idx (없으면 전체) 중에서 guess에 feedback을 받을 수 있는 단어들의 인덱스
+        pattern matrix가 있으면 posting list의 구간을 idx와 교집합하고, 없으면 constraint index의 bitset으로 찾는다
+        (pattern matrix는 문제의 규칙으로 만들어졌고, constraint index는 KERNEL_RULE을 따른다)
+        0 / 1 / 2가 아닌 값이 있는 feedback은 어떤 단어와도 맞지 않는다
+        '''
+        if not is_feedback(feedback):
+            return np.arange(0) if idx is None else np.asarray(idx)[:0]
+        if problem["postings"] is not None:
+            return problem["postings"].filter(guess, feedback_to_code(feedback), idx)
+        return problem["constraints"].filter(problem["words"][guess], feedback, idx)
+
+    def _turn_budget(self, problem, turn, num_plausibles):
+        '''
+        이번 턴에 쓸 수 있는 시간 (초). 남은 시간을 앞으로 남은 예상 턴 수로 나누고,
+        이후 턴마다 LLM 번역 시간을 미리 떼어 둔다
+        '''
+        elapsed = time.time() - problem["start_time"]
+        remaining = self.problem_limit - elapsed - self.safety_margin
+        # ~4 bits per guess is what the entropy guesses usually get
+        expected_turns = max(1, int(np.ceil(np.log2(num_plausibles + 1) / 4)))
+        budget = (remaining - (expected_turns - 1) * self.feedback_seconds) / expected_turns
+        if turn == 1:
+            budget = min(budget, self.first_guess_limit - elapsed - self.safety_margin)
+        return max(budget, 0.05)
+
     def _log(self, msg):
         ts = datetime.datetime.now().isoformat()
         self.log_file.write(f"[{ts}] {msg}\n")
@@ -434,7 +667,7 @@ class StudentHandler(BaseHTTPRequestHandler):
         if self.path == "/start_problem":
             problem_id = data["problem_id"]
             candidate_words = data["candidate_words"]
-            solver.start_problem(problem_id, candidate_words)
+            solver.start_problem(problem_id, candidate_words, data.get("feedback_rule"))
             self.send_response(200)
             self.end_headers()
             return
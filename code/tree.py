@@ -0,0 +1,151 @@
+import os
+from collections import deque
+
+import numpy as np
+
+from book import choose_guess
+from patterns import SOLVED, CACHE_DIR, encode_words, feedback_codes, fingerprint, load_pattern_matrix, sorted_words
+from scoring import DEFAULT_RAM_CAP, BucketHistograms
+from search import BEAM_BRANCH, MINIMAX_BRANCH, STRATEGIES, ExactSolver, MinimaxSolver, minimax_guess
+
+
+def tree_path(words, cache_dir=None, strategy="expected") -> str:
+    # the expected-guess tree keeps the plain name, other strategies get their own file
+    suffix = "" if strategy == "expected" else f".{strategy}"
+    return os.path.join(cache_dir or CACHE_DIR, f"{fingerprint(words)}{suffix}.tree.npy")
+
+
+class DecisionTree:
+    '''
+    노드 i에서는 guess[i]를 질의하고, 피드백 코드 c를 받으면 child(i, c) 노드로 간다. 루트는 0
+    파일 하나에 [노드 수, 간선 수, guess, child_start, edge_code, edge_child]를 int32로 이어 붙여 저장한다
+    '''
+
+    def __init__(self, flat):
+        num_nodes, num_edges = int(flat[0]), int(flat[1])
+        offset = 2
+        self.guess = flat[offset:offset + num_nodes]
+        offset += num_nodes
+        self.child_start = flat[offset:offset + num_nodes + 1]
+        offset += num_nodes + 1
+        self.edge_code = flat[offset:offset + num_edges]
+        offset += num_edges
+        self.edge_child = flat[offset:offset + num_edges]
+        self.flat = flat
+
+    def child(self, node, code):
+        start, stop = self.child_start[node], self.child_start[node + 1]
+        pos = start + np.searchsorted(self.edge_code[start:stop], code)
+        if pos < stop and self.edge_code[pos] == code:
+            return int(self.edge_child[pos])
+        return None
+
+    def answer_depths(self, words, patterns=None) -> np.ndarray:
+        '''
+        depth[a] = 정답이 a일 때 트리를 따라가면 쓰는 guess 수. 모든 정답을 한 단계씩 같이 진행한다
+        '''
+        N = len(words)
+        depth = np.zeros(N, dtype=np.int32)
+        node = np.zeros(N, dtype=np.int64)
+        active = np.arange(N)
+        step = 0
+        while len(active):
+            step += 1
+            guess = np.asarray(self.guess)[node[active]]
+            if patterns is not None:
+                codes = np.asarray(patterns[guess, active])
+            else:
+                codes = np.empty(len(active), dtype=np.uint8)
+                for g in np.unique(guess):
+                    same = guess == g
+                    codes[same] = feedback_codes(words[[g]], words[active[same]])[0]
+            solved = codes == SOLVED
+            depth[active[solved]] = step
+            next_node = [self.child(n, c) for n, c in zip(node[active[~solved]], codes[~solved])]
+            active = active[~solved]
+            node[active] = next_node
+        return depth
+
+
+def compile_tree(words, patterns=None, strategy="expected", ram_cap=DEFAULT_RAM_CAP) -> DecisionTree:
+    '''
+    plausible 집합마다 솔버와 같은 규칙으로 guess를 정하며 BFS로 트리 전체를 만든다
+    strategy: "expected"면 book.choose_guess, "minimax"면 search.minimax_guess
+    '''
+    words = sorted_words(words)
+    N = len(words)
+    # one search for the whole tree, so its transposition table already holds most subtrees
+    if strategy == "minimax":
+        choose = lambda *args: minimax_guess(*args)[0]
+        search = MinimaxSolver(words, patterns, branch=MINIMAX_BRANCH)
+    else:
+        choose, search = choose_guess, ExactSolver(words, patterns, branch=BEAM_BRANCH)
+
+    guesses, child_start, edge_code, edge_child = [], [0], [], []
+    queue = deque([np.arange(N)])
+    num_nodes = 1
+    while queue:
+        plausible_idx = queue.popleft()
+        if len(plausible_idx) == 1:
+            guess = int(plausible_idx[0])
+        else:
+            guess = choose(words, plausible_idx, BucketHistograms(words, patterns, ram_cap), search)
+        guesses.append(guess)
+
+        if patterns is not None:
+            codes = np.asarray(patterns[guess, plausible_idx])
+        else:
+            codes = feedback_codes(words[[guess]], words[plausible_idx])[0]
+        for code in np.unique(codes):
+            if code == SOLVED:
+                continue
+            edge_code.append(int(code))
+            edge_child.append(num_nodes)
+            num_nodes += 1
+            queue.append(plausible_idx[codes == code])
+        child_start.append(len(edge_code))
+
+    flat = np.concatenate([
+        [len(guesses), len(edge_code)], guesses, child_start, edge_code, edge_child,
+    ]).astype(np.int32)
+    return DecisionTree(flat)
+
+
+def save_tree(words, tree, cache_dir=None, strategy="expected"):
+    path = tree_path(words, cache_dir, strategy)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, tree.flat)
+    os.replace(tmp_path, path)
+
+
+def load_tree(words, cache_dir=None, strategy="expected"):
+    path = tree_path(words, cache_dir, strategy)
+    if not os.path.exists(path):
+        return None
+    return DecisionTree(np.load(path, mmap_mode="r"))
+
+
+if __name__ == "__main__":
+    # compile: python tree.py words.txt [--strategy minimax]
+    # max guesses printed at the end is the depth the strategy guarantees for this list
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="compile the full guess decision tree for a word list")
+    parser.add_argument("word_file", nargs="?", default="words.txt")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="expected")
+    args = parser.parse_args()
+
+    words = encode_words(open(args.word_file).read().strip().split('\n'))
+    start_time = time.time()
+    patterns = load_pattern_matrix(words, cache_dir=args.cache_dir)
+    tree = compile_tree(words, patterns, args.strategy)
+    save_tree(words, tree, args.cache_dir, args.strategy)
+
+    answer_depth = tree.answer_depths(sorted_words(words), patterns)
+    print(f"{tree_path(words, args.cache_dir, args.strategy)}: {len(tree.guess)} nodes in {time.time() - start_time:.2f}s, "
+          f"mean {answer_depth.mean():.4f} / max {answer_depth.max()} guesses")
+    print(f"guaranteed depth ({args.strategy}): every answer within {answer_depth.max()} guesses, "
+          f"{np.bincount(answer_depth).tolist()[1:]} answers at depth 1..{answer_depth.max()}")